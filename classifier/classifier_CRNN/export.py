@@ -0,0 +1,56 @@
+import argparse
+import os
+import time
+import torch
+import models.crnn as crnn
+import config_crnn
+
+pretrained = config_crnn.pretrained_test
+imgH = config_crnn.imgH
+alphabet_path = config_crnn.alphabet_path
+example_width = 512
+onnx_opset = 11
+
+
+def build_model(ckpt_path, imgH=imgH, alphabet_path=alphabet_path, nc=3, nh=256):
+    nclass = len(open(alphabet_path, encoding='utf-8').read().rstrip()) + 1
+    if imgH == 32:
+        model = crnn.CRNN32(imgH, nc, nclass, nh)
+    else:
+        model = crnn.CRNN64(imgH, nc, nclass, nh)
+    model.load_state_dict(torch.load(ckpt_path, map_location='cpu'))
+    return model.eval()
+
+
+def export_onnx(model, output_path, imgH=imgH, width=example_width, opset=onnx_opset):
+    '''
+    Export a CRNN to ONNX with dynamic batch and width, e.g. for onnxruntime (utils/onnx_backend.py).
+    Input: (batch, 3, imgH, width) normalized images, output: (length, batch, nclass) raw scores.
+    '''
+    model = model.cpu().eval()
+    example = torch.zeros(1, 3, imgH, width)
+    with torch.no_grad():
+        torch.onnx.export(model, example, output_path, input_names=['image'], output_names=['preds'],
+                          dynamic_axes={'image': {0: 'batch', 3: 'width'},
+                                        'preds': {0: 'length', 1: 'batch'}},
+                          opset_version=opset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a CRNN checkpoint to ONNX')
+    parser.add_argument('--ckpt', type=str, default=pretrained)
+    parser.add_argument('--output', type=str, help='Defaults to the checkpoint path with a .onnx extension')
+    parser.add_argument('--imgH', type=int, default=imgH)
+    parser.add_argument('--alphabet', type=str, default=alphabet_path)
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.ckpt)[0] + '.onnx'
+
+    model = build_model(args.ckpt, imgH=args.imgH, alphabet_path=args.alphabet)
+    begin = time.time()
+    export_onnx(model, output, imgH=args.imgH)
+    print('Exported', output, 'in', round(time.time() - begin, 2), 'seconds,',
+          round(os.path.getsize(output) / 2 ** 20, 2), 'MB')
+
+
+if __name__ == '__main__':
+    main()
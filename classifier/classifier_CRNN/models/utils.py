@@ -8,6 +8,7 @@ import collections
 import Levenshtein
 # import tensorflow as tf
 import numpy as np
+import cv2
 from PIL import Image
 from torchvision.transforms import ToTensor, Normalize
 
@@ -68,6 +69,42 @@ def resizePadding(img, width, height):
     return img
 
 
+_norm_scale = (1.0 / (255.0 * np.array(std))).astype(np.float32)
+_norm_offset = (np.array(mean) / np.array(std)).astype(np.float32)
+
+
+def resizePaddingNumpy(img, width, height, out=None, fill=(255, 255, 255)):
+    """cv2/NumPy version of resizePadding for ndarray crops, without PIL round trip.
+
+    The crop is resized to `height` keeping its ratio (capped at `width`), normalized
+    and written into `out` (3, height, width) float32, the rest is padded with `fill`.
+    Channels are kept in array order, as `Image.fromarray(img).convert('RGB')` does.
+    """
+    if out is None:
+        out = np.empty((3, height, width), dtype=np.float32)
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        img = img[:, :, :3]
+    img_h, img_w = img.shape[:2]
+    new_w = min(width, int(height * (1.0 * img_w / img_h)))
+    interpolation = cv2.INTER_AREA if img_h > height else cv2.INTER_CUBIC
+    img = cv2.resize(img, (new_w, height), interpolation=interpolation).astype(np.float32)
+    img *= _norm_scale
+    img -= _norm_offset
+    out[:, :, :new_w] = img.transpose(2, 0, 1)
+    out[:, :, new_w:] = (np.array(fill, dtype=np.float32) * _norm_scale - _norm_offset)[:, None, None]
+    return out
+
+
+def loadNumpyBatch(imgs, width, height, fill=(255, 255, 255)):
+    """Resize-pad-normalize ndarray crops straight into one preallocated (N, 3, height, width) batch."""
+    batch = np.empty((len(imgs), 3, height, width), dtype=np.float32)
+    for idx, img in enumerate(imgs):
+        resizePaddingNumpy(img, width, height, batch[idx], fill)
+    return torch.from_numpy(batch)
+
+
 def maxWidth(sizes, height):
     ws = [int(height * (1.0 * size[0] / size[1])) for size in sizes]
     maxw = max(ws)
@@ -91,6 +128,7 @@ class strLabelConverter(object):
         if self._ignore_case:
             alphabet = alphabet.lower()
         self.alphabet = alphabet + '-'  # for `-1` index
+        self.alphabet_array = np.array(list(self.alphabet))  # index-to-char lookup of decode_batch
 
         self.dict = {}
         for i, char in enumerate(alphabet):
@@ -160,6 +198,34 @@ class strLabelConverter(object):
             return texts
 
 
+    def decode_batch(self, preds):
+        """Greedy CTC decoding of a whole batch at once.
+
+        Argmax, collapse of repeats and blank removal run on the whole batch,
+        only the final index-to-char lookup is done per text.
+
+        Args:
+            preds (torch.Tensor [T, b, nclass]): raw model output.
+
+        Returns:
+            texts (list of str): decoded texts.
+            char_scores (list of np.ndarray): probability of every decoded character.
+            scores (list of float): probability of every text, product of its character probabilities,
+                0 for an empty text.
+        """
+        probs, indices = preds.detach().softmax(2).max(2)
+        probs = probs.transpose(1, 0).cpu().numpy()  # [b, T]
+        indices = indices.transpose(1, 0).cpu().numpy()
+        keep = indices != 0
+        keep[:, 1:] &= indices[:, 1:] != indices[:, :-1]
+        texts, char_scores, scores = [], [], []
+        for b in range(indices.shape[0]):
+            texts.append(''.join(self.alphabet_array[indices[b][keep[b]] - 1]))
+            char_scores.append(probs[b][keep[b]])
+            scores.append(float(np.prod(char_scores[-1])) if len(char_scores[-1]) > 0 else 0.)
+        return texts, char_scores, scores
+
+
 class averager(object):
     """Compute average for `torch.Variable` and `torch.Tensor`. """
 
@@ -0,0 +1,160 @@
+import argparse
+import copy
+import sys
+import time
+import torch
+import torch.nn as nn
+import torch.utils.data
+import models.utils as utils
+from utils.loader import ImageFileLoader, ratioAlignCollate
+from export import build_model
+import config_crnn
+
+data_dir = config_crnn.test_dir
+pretrained = config_crnn.pretrained_test
+imgH = config_crnn.imgH
+alphabet_path = config_crnn.alphabet_path
+batch_size = 16
+quantize_engine = 'fbgemm'  # x86, 'qnnpack' on arm
+num_calibration_batches = 32
+max_cer_increase = 0.002  # absolute, allowed CER loss of the int8 model
+
+
+def quantize_dynamic(model):
+    '''int8 weights for the LSTM and Linear layers, activations quantized on the fly.'''
+    return torch.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+
+class QuantizedCNN(nn.Module):
+    def __init__(self, cnn):
+        super(QuantizedCNN, self).__init__()
+        self.quant = torch.quantization.QuantStub()
+        self.cnn = cnn
+        self.dequant = torch.quantization.DeQuantStub()
+
+    def forward(self, input):
+        return self.dequant(self.cnn(self.quant(input)))
+
+
+def fuse_cnn(cnn):
+    '''Fuse the convN / batchnormN / reluN modules of the CRNN trunk, in place.'''
+    groups = []
+    for name, module in cnn.named_children():
+        if not name.startswith('conv'):
+            continue
+        index = name[len('conv'):]
+        group = [name]
+        if 'batchnorm' + index in cnn._modules:
+            group.append('batchnorm' + index)
+        if isinstance(cnn._modules.get('relu' + index), nn.ReLU):
+            group.append('relu' + index)
+        if len(group) > 1:
+            groups.append(group)
+    return torch.quantization.fuse_modules(cnn, groups, inplace=True)
+
+
+def quantize_static(model, calibration_batches, engine=quantize_engine):
+    '''
+    Static int8 cnn trunk calibrated on calibration_batches (normalized image tensors),
+    plus dynamic int8 LSTM / Linear layers.
+    '''
+    model = copy.deepcopy(model).eval()
+    torch.backends.quantized.engine = engine
+    cnn = QuantizedCNN(fuse_cnn(model.cnn))
+    cnn.qconfig = torch.quantization.get_default_qconfig(engine)
+    torch.quantization.prepare(cnn, inplace=True)
+    with torch.no_grad():
+        for images in calibration_batches:
+            cnn(images)
+    torch.quantization.convert(cnn, inplace=True)
+    model.cnn = cnn
+    return quantize_dynamic(model)
+
+
+def quantize_model(model, mode='dynamic', calibration_batches=None):
+    model = model.cpu().eval()
+    if mode == 'dynamic':
+        return quantize_dynamic(model)
+    if mode == 'static':
+        return quantize_static(model, calibration_batches)
+    raise ValueError('Unknown quantization mode: %s' % mode)
+
+
+def get_loader(root, flist, imgH=imgH, batch_size=batch_size, shuffle=False, label=True):
+    dataset = ImageFileLoader(root, flist, label=label)
+    return torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=shuffle,
+                                       collate_fn=ratioAlignCollate(imgH))
+
+
+def calibration_set(root, flist, imgH=imgH, num_batches=num_calibration_batches, batch_size=batch_size):
+    '''num_batches random batches of ImageFileLoader images, for the static quantization observers.'''
+    batches = []
+    for images, _, _ in get_loader(root, flist, imgH, batch_size, shuffle=True, label=False):
+        batches.append(images)
+        if len(batches) == num_batches:
+            break
+    return batches
+
+
+def evaluate(model, loader, converter):
+    '''Returns the mean CER over the loader and the recognition throughput in crops/s.'''
+    cers = []
+    num_crops = 0
+    total_time = 0.
+    with torch.no_grad():
+        for images, labels, _ in loader:
+            begin = time.time()
+            preds = model(images)
+            texts, _, _ = converter.decode_batch(preds)
+            total_time += time.time() - begin
+            num_crops += images.size(0)
+            cers.extend(utils.cer_loss(texts, labels))
+    return sum(cers) / max(len(cers), 1), num_crops / max(total_time, 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='int8 CRNN: CER regression check and CPU benchmark against fp32')
+    parser.add_argument('--root', default=data_dir, help='path to root folder')
+    parser.add_argument('--val', default='', help='list of labelled test images in root')
+    parser.add_argument('--calib', default='', help='list of calibration images in root, defaults to --val')
+    parser.add_argument('--ckpt', type=str, default=pretrained)
+    parser.add_argument('--imgH', type=int, default=imgH)
+    parser.add_argument('--alphabet', type=str, default=alphabet_path)
+    parser.add_argument('--mode', choices=['dynamic', 'static'], default='dynamic')
+    parser.add_argument('--batch_size', type=int, default=batch_size)
+    parser.add_argument('--num_calibration_batches', type=int, default=num_calibration_batches)
+    parser.add_argument('--max_cer_increase', type=float, default=max_cer_increase)
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    parser.add_argument('--output', type=str, help='save the quantized model as TorchScript, e.g. crnn_int8.torchscript')
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    alphabet = open(args.alphabet, encoding='utf-8').read().rstrip()
+    converter = utils.strLabelConverter(alphabet, ignore_case=False)
+    model = build_model(args.ckpt, imgH=args.imgH, alphabet_path=args.alphabet)
+    calibration_batches = None
+    if args.mode == 'static':
+        calibration_batches = calibration_set(args.root, args.calib or args.val, args.imgH,
+                                              args.num_calibration_batches, args.batch_size)
+    quantized = quantize_model(model, args.mode, calibration_batches)
+
+    loader = get_loader(args.root, args.val, args.imgH, args.batch_size)
+    fp32_cer, fp32_speed = evaluate(model, loader, converter)
+    int8_cer, int8_speed = evaluate(quantized, loader, converter)
+    print('fp32: CER %.4f, %.1f crops/s' % (fp32_cer, fp32_speed))
+    print('int8 (%s): CER %.4f, %.1f crops/s' % (args.mode, int8_cer, int8_speed))
+    print('CER increase %.4f, speedup %.2fx' % (int8_cer - fp32_cer, int8_speed / fp32_speed))
+
+    if args.output:
+        example = torch.zeros(1, 3, args.imgH, args.imgH * 8)
+        with torch.no_grad():
+            torch.jit.save(torch.jit.trace(quantized, example), args.output)
+        print('Saved', args.output)
+    if int8_cer - fp32_cer > args.max_cer_increase:
+        print('CER regression above', args.max_cer_increase)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
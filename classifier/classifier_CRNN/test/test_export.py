@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+import torch
+origin_path = sys.path
+sys.path.append("..")
+import models.crnn as crnn
+from export import export_onnx
+sys.path = origin_path
+
+
+class exportTestCase(unittest.TestCase):
+
+    def checkOnnx(self):
+        import onnxruntime
+        torch.manual_seed(0)
+        model = crnn.CRNN64(64, 3, 30, 256).eval()
+        output_path = os.path.join(tempfile.mkdtemp(), 'crnn.onnx')
+        export_onnx(model, output_path, imgH=64, width=256)
+        session = onnxruntime.InferenceSession(output_path, providers=['CPUExecutionProvider'])
+        for batch_size, width in [(1, 256), (4, 640), (2, 96)]:
+            image = torch.rand(batch_size, 3, 64, width)
+            with torch.no_grad():
+                target = model(image).numpy()
+            result = session.run(None, {'image': image.numpy()})[0]
+            assert result.shape == target.shape
+            assert np.abs(result - target).max() < 1e-3
+            assert (result.argmax(2) == target.argmax(2)).mean() > 0.99
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(exportTestCase("checkOnnx"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
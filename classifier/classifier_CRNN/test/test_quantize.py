@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import sys
+import unittest
+import numpy as np
+import torch
+origin_path = sys.path
+sys.path.append("..")
+import models.crnn as crnn
+from quantize import quantize_model
+sys.path = origin_path
+
+
+class quantizeTestCase(unittest.TestCase):
+
+    def checkQuantize(self):
+        torch.manual_seed(0)
+        model = crnn.CRNN64(64, 3, 30, 256).eval()
+        calibration_batches = [torch.randn(4, 3, 64, 160) for _ in range(4)]
+        image = torch.randn(2, 3, 64, 256)
+        with torch.no_grad():
+            target = model(image).numpy()
+            for mode in ['dynamic', 'static']:
+                quantized = quantize_model(model, mode, calibration_batches)
+                result = quantized(image).numpy()
+                assert result.shape == target.shape
+                assert np.corrcoef(result.ravel(), target.ravel())[0, 1] > 0.95
+            # the fp32 model is left as it is
+            assert np.array_equal(model(image).numpy(), target)
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(quantizeTestCase("checkQuantize"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
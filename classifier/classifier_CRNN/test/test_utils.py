@@ -6,6 +6,9 @@ import unittest
 import torch
 from torch.autograd import Variable
 import collections
+import cv2
+import numpy as np
+from PIL import Image
 origin_path = sys.path
 sys.path.append("..")
 import utils
@@ -67,6 +70,22 @@ class utilsTestCase(unittest.TestCase):
         target = ['efa', 'ab']
         self.assertTrue(equal(result, target))
 
+    def checkDecodeBatch(self):
+        from models.utils import strLabelConverter
+        encoder = strLabelConverter('abcdefghijklmnopqrstuvwxyz')
+        # [T, b] best paths: 'e e - f a', '- a b b -' and all blanks
+        best = torch.LongTensor([[5, 0, 0], [5, 1, 0], [0, 2, 0], [6, 2, 0], [1, 0, 0]])
+        preds = torch.full((5, 3, 27), -10.)
+        preds.scatter_(2, best.unsqueeze(2), 10.)
+        texts, char_scores, scores = encoder.decode_batch(preds)
+        assert texts == ['efa', 'ab', '']
+        assert [len(c) for c in char_scores] == [3, 2, 0]
+        assert all(0.99 < score <= 1. for score in scores[:2])
+        assert scores[2] == 0.
+
+        target = encoder.decode(best.transpose(1, 0).contiguous().view(-1), torch.IntTensor([5, 5, 5]))
+        assert texts == target
+
     def checkOneHot(self):
         v = torch.LongTensor([1, 2, 1, 2, 0])
         v_length = torch.LongTensor([2, 3])
@@ -92,13 +111,25 @@ class utilsTestCase(unittest.TestCase):
         img = utils.assureRatio(img)
         assert torch.Size([1, 1, 2, 2]) == img.size()
 
+    def checkResizePaddingNumpy(self):
+        from models.utils import resizePadding, resizePaddingNumpy
+        for h, w in [(30, 200), (64, 300), (100, 800)]:
+            img = np.full((h, w, 3), 230, dtype=np.uint8)
+            cv2.putText(img, 'Hoa Don 123', (2, h - 5), cv2.FONT_HERSHEY_SIMPLEX, h / 40., (20, 20, 20), 2)
+            target = resizePadding(Image.fromarray(img).convert('RGB'), 1000, 64).numpy()
+            result = resizePaddingNumpy(img, 1000, 64)
+            assert result.shape == target.shape
+            assert np.abs(result - target).mean() < 0.02
+
 
 def _suite():
     suite = unittest.TestSuite()
     suite.addTest(utilsTestCase("checkConverter"))
+    suite.addTest(utilsTestCase("checkDecodeBatch"))
     suite.addTest(utilsTestCase("checkOneHot"))
     suite.addTest(utilsTestCase("checkAverager"))
     suite.addTest(utilsTestCase("checkAssureRatio"))
+    suite.addTest(utilsTestCase("checkResizePaddingNumpy"))
     return suite
 
 
@@ -1,12 +1,14 @@
-import torchvision
 import torch
 import os
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import torch.utils.data as data
+from torch.utils.data.dataloader import default_collate
 from PIL import Image
 try:
-    from models.utils import resizePadding
+    from models.utils import resizePadding, loadNumpyBatch
 except ImportError:
-    from classifier_CRNN.models.utils import resizePadding
+    from classifier_CRNN.models.utils import resizePadding, loadNumpyBatch
 
 def default_flist_reader(root, flist):
     imlist = []
@@ -38,6 +40,88 @@ class alignCollate(object):
         images = torch.cat([t.unsqueeze(0) for t in images], 0)
         return images, labels, img_paths
 
+class ratioAlignCollate(object):
+    '''Resize-pad the images of a batch to the largest w/h ratio of that batch only.'''
+    def __init__(self, imgH, max_wh_ratio=None):
+        self.imgH = imgH
+        self.max_wh_ratio = max_wh_ratio
+
+    def __call__(self, batch):
+        images, labels, img_paths = zip(*batch)
+        wh_ratio = max(1.0 * image.size[0] / image.size[1] for image in images)
+        if self.max_wh_ratio is not None:
+            wh_ratio = min(wh_ratio, self.max_wh_ratio)
+        imgW = int(self.imgH * wh_ratio)
+        images = [resizePadding(image, imgW, self.imgH) for image in images]
+        images = torch.cat([t.unsqueeze(0) for t in images], 0)
+        return images, labels, img_paths
+
+class numpyAlignCollate(object):
+    '''
+    Same as alignCollate / ratioAlignCollate for ndarray samples (NumpyListLoader with to_pil=False):
+    crops are resized, padded and normalized by cv2/NumPy straight into one float32 batch.
+    Without imgW, the batch is padded to its own largest w/h ratio (capped at max_wh_ratio).
+    '''
+    def __init__(self, imgH, imgW=None, max_wh_ratio=None, fill=(255, 255, 255)):
+        self.imgH = imgH
+        self.imgW = imgW
+        self.max_wh_ratio = max_wh_ratio
+        self.fill = fill
+
+    def __call__(self, batch):
+        images, labels, img_paths = zip(*batch)
+        imgW = self.imgW
+        if imgW is None:
+            wh_ratio = max(1.0 * image.shape[1] / image.shape[0] for image in images)
+            if self.max_wh_ratio is not None:
+                wh_ratio = min(wh_ratio, self.max_wh_ratio)
+            imgW = int(self.imgH * wh_ratio)
+        images = loadNumpyBatch(images, imgW, self.imgH, self.fill)
+        return images, labels, img_paths
+
+def ratio_buckets(wh_ratios, batch_size):
+    '''
+    Sort samples by w/h ratio and split them into batches of similar ratio,
+    so that short fields are not padded to the width of the longest one.
+    Returns a list of index lists, usable as DataLoader batch_sampler.
+    '''
+    order = sorted(range(len(wh_ratios)), key=lambda i: wh_ratios[i])
+    return [order[begin:begin + batch_size] for begin in range(0, len(order), batch_size)]
+
+class PreprocessPool(object):
+    '''
+    Long-lived pool preparing recognition batches, kept alive between requests instead of
+    forking DataLoader workers (and pickling every crop to them) on each call.
+    Workers are threads: PIL/cv2 resize release the GIL. Inputs with fewer than
+    min_parallel samples are prepared in the calling thread.
+    '''
+    def __init__(self, workers=4, min_parallel=8):
+        self.workers = workers
+        self.min_parallel = min_parallel
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+
+    def iterate(self, dataset, batches, collate_fn=default_collate):
+        '''Yield collate_fn of every batch of dataset indices, in order, at most `workers` batches ahead.'''
+        def load(indices):
+            return collate_fn([dataset[i] for i in indices])
+
+        if self.executor is None or sum(len(indices) for indices in batches) < self.min_parallel:
+            for indices in batches:
+                yield load(indices)
+            return
+        futures = collections.deque()
+        for indices in batches:
+            futures.append(self.executor.submit(load, indices))
+            if len(futures) > self.workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
 class ImageFileLoader(data.Dataset):
     def __init__(self, root,  flist = '', flist_reader = default_flist_reader, transform=None, label=True):
         self.root = root
@@ -61,12 +145,15 @@ class ImageFileLoader(data.Dataset):
         return len(self.imlist)
 
 class NumpyListLoader(data.Dataset):  #no label
-    def __init__(self, numpylist, transform=None):
+    def __init__(self, numpylist, transform=None, to_pil=True):
         self.imlist = numpylist
         self.transform = transform
+        self.to_pil = to_pil  # False: return the ndarray as is, to be batched by numpyAlignCollate
 
     def __getitem__(self, index):
         imdata = self.imlist[index]
+        if not self.to_pil:
+            return imdata, '', ''
         img = Image.fromarray(imdata).convert('RGB')
         if self.transform is not None:
             img = self.transform(img)
@@ -3,6 +3,7 @@ import base64
 import sys
 
 sys.path.insert(0, str(pathlib.Path(__file__).parent.absolute()) + '/classifier_CRNN')
+sys.path.insert(0, str(pathlib.Path(__file__).parent.absolute()) + '/utils')
 
 import torch
 from torch.autograd import Variable
@@ -13,7 +14,8 @@ import os
 import pickle, json
 
 import cv2
-from classifier_CRNN.utils.loader import alignCollate, NumpyListLoader
+from classifier_CRNN.utils.loader import alignCollate, NumpyListLoader, numpyAlignCollate, ratio_buckets, \
+    PreprocessPool
 
 from torchvision import transforms
 from classifier_CRNN.pre_processing.image_preprocessing import extract_for_demo, extract_for_demo_json, \
@@ -26,8 +28,17 @@ from classifier_CRNN.symspellpy.general_spell_check import load_country_correcti
 from classifier_CRNN.symspellpy.general_spell_check import load_relationship_correction, correct_relationship
 from classifier_CRNN.symspellpy.general_spell_check import correct_date
 from classifier_CRNN.form.form_processing import visualize_boxes, visualize_boxes_json
-from classifier_CRNN.pre_processing.augment_functions import cnd_aug_resizePadding
 from api_server.util import aicr_db
+from stage_timer import timers, profile
+
+# time every NLP corrector
+correct_address = timers.timed('nlp_correct_address')(correct_address)
+correct_PlaceOfIssueId = timers.timed('nlp_correct_place_of_issue')(correct_PlaceOfIssueId)
+correct_name = timers.timed('nlp_correct_name')(correct_name)
+correct_cpn = timers.timed('nlp_correct_cpn')(correct_cpn)
+correct_country = timers.timed('nlp_correct_country')(correct_country)
+correct_relationship = timers.timed('nlp_correct_relationship')(correct_relationship)
+correct_date = timers.timed('nlp_correct_date')(correct_date)
 
 im = 5
 img_list = ['I-1.png', 'II-2.png', 'III-5.png', 'IV-1.png', 'VI-1.jpg', 'VII-1.jpg']
@@ -47,11 +58,14 @@ gpu = '1'
 alphabet_path = 'classifier_CRNN/data/char_246'
 workers = 4
 batch_size = 8
+bucketing = True
+min_parallel = 8  # fewer fields than this are preprocessed in the calling thread
 
 label = False
 debug = False
 calib = False
 subtract_bgr = False
+profile_dir = 'outputs'
 alphabet = open(alphabet_path, encoding='UTF-8').read().rstrip()
 nclass = len(alphabet) + 1
 nc = 3
@@ -105,42 +119,36 @@ def init_post_processing(address_db_path, name_db, name_bigram, country_db, rela
     return address_db, name_db, country_db, relationship_db
 
 
-def recognize(model, converter, image, list_obj, batch_sz, max_wh_ratio, max_iter=10000):
+def recognize(model, converter, image, list_obj, batch_sz, max_wh_ratio, max_iter=10000, bucketing=bucketing):
     numpy_list = []
     for obj in list_obj:
         numpy_list.append(obj.data)
 
-    new_imgW = int(max_wh_ratio * imgH)
-    transform_test = transforms.Compose([cnd_aug_resizePadding(new_imgW, imgH, fill=fill_color, train=False),
-                                         transforms.ToTensor(),
-                                         transforms.Normalize(mean, std)
-                                         ])
-    list_value = []
-    val_dataset = NumpyListLoader(numpy_list, transform=transform_test)
-    val_loader = torch.utils.data.DataLoader(
-        val_dataset,
-        batch_size=batch_sz,
-        num_workers=workers,
-        shuffle=False
-    )
-    val_iter = iter(val_loader)
-    max_iter = min(max_iter, len(val_loader))
+    if bucketing:
+        # pad every batch to its own widest field instead of the widest field of the page
+        wh_ratios = [1.0 * data.shape[1] / data.shape[0] for data in numpy_list]
+        batches = ratio_buckets(wh_ratios, batch_sz)
+        collate = numpyAlignCollate(imgH, max_wh_ratio=max_wh_ratio, fill=fill_color)
+    else:
+        new_imgW = int(max_wh_ratio * imgH)
+        batches = [list(range(begin, min(begin + batch_sz, len(numpy_list))))
+                   for begin in range(0, len(numpy_list), batch_sz)]
+        collate = numpyAlignCollate(imgH, imgW=new_imgW, fill=fill_color)
+    collate = timers.timed('crnn_preprocess')(collate)
+    val_loader = preprocess_pool.iterate(NumpyListLoader(numpy_list, to_pil=False), batches, collate_fn=collate)
+    list_value = [None] * len(numpy_list)
+    max_iter = min(max_iter, len(batches))
     with torch.no_grad():
-        for i in range(max_iter):
-            data = val_iter.next()
+        for indices, data in zip(batches[:max_iter], val_loader):
             cpu_images, cpu_texts, _ = data
             batch_size = cpu_images.size(0)
             utils.loadData(image, cpu_images)
-            preds = model(image)
-            preds_size = Variable(torch.IntTensor(
-                [preds.size(0)] * batch_size))
-            _, preds = preds.max(2)
-            preds = preds.transpose(1, 0).contiguous().view(-1)
-            sim_pred = converter.decode(preds.data, preds_size.data, raw=False)
-            if (batch_sz > 1):
-                list_value.extend(sim_pred)
-            else:
-                list_value.append(sim_pred)
+            with timers.timer('crnn_forward'):
+                preds = model(image)
+            with timers.timer('ctc_decode'):
+                sim_pred, _, _ = converter.decode_batch(preds)
+            for idx, value in zip(indices, sim_pred):
+                list_value[idx] = value
 
             if debug:
                 # raw_pred = converter.decode(preds.data, preds_size.data, raw=True)
@@ -154,6 +162,8 @@ def recognize(model, converter, image, list_obj, batch_sz, max_wh_ratio, max_ite
                     break
     # assign again
     for idx, value in enumerate(list_value):
+        if value is None:  # not recognized, stopped by max_iter or debug
+            continue
         setattr(list_obj[idx], 'value', value)
         if list_obj[idx].type in ['name', 'city', 'ward', 'district', 'street', 'country'] or \
                 list_obj[idx].id in [10, 39]:
@@ -164,6 +174,7 @@ init = False
 if not init:
     begin_init = time.time()
     model, converter, image = init_models(batch_size)
+    preprocess_pool = PreprocessPool(workers, min_parallel)
     address_db, name_db, country_db, relationship_db = init_post_processing(
         'classifier_CRNN/symspellpy/data/db.pickle',
         'classifier_CRNN/symspellpy/data/freq_name_dic.txt',
@@ -243,7 +254,13 @@ def NLP_SDV_invoice(list_clImageInfor_final, start_idx_img, end_idx_img):
 
 def predict_json(list_img_path, batch_size=16, post_processing=True,
                  address_csv_path='classifier_CRNN/symspellpy/data/dvhcvn.csv',
-                 template_id=1, local=False, image_directory=None):
+                 template_id=1, local=False, image_directory=None, profile_kind=None):
+    '''profile_kind: None, 'cprofile' or 'torch' to profile this request, written to profile_dir.'''
+    if profile_kind is not None:
+        profile_path = os.path.join(profile_dir, 'predict_json_%d' % int(time.time() * 1000))
+        with profile(profile_kind, profile_path):
+            return predict_json(list_img_path, batch_size, post_processing, address_csv_path, template_id, local,
+                                image_directory)
     list_img_path = sorted(list_img_path)
     num_imgs = len(list_img_path)
     print('Predict', num_imgs, 'images')
@@ -264,6 +281,7 @@ def predict_json(list_img_path, batch_size=16, post_processing=True,
 
     end_transform = time.time()
     print('Get data time:', end_transform - begin_transform, 'seconds')
+    timers.add('get_data', end_transform - begin_transform)
 
     list_clImageInfor_final = []
     list_mark_final = []
@@ -295,12 +313,14 @@ def predict_json(list_img_path, batch_size=16, post_processing=True,
     num_samples_mark = len(list_mark_final)
     end_extract = time.time()
     print('Extract data time:', end_extract - end_transform, 'seconds')
+    timers.add('extract', end_extract - end_transform)
 
     print('\nStart recognize')
     print('Number of samples', num_samples_img)
     recognize(model, converter, image, list_clImageInfor_final, batch_size, max_wh)
     end_predict = time.time()
     processing_time = end_predict - end_extract
+    timers.add('recognize', processing_time)
     print('Recognize time:', round(processing_time, 4), 'seconds. Speed:', round(num_samples_img / processing_time, 2),
           'samples/s')
 
@@ -314,6 +334,7 @@ def predict_json(list_img_path, batch_size=16, post_processing=True,
 
     end_spell_checking = time.time()
     print('Spell checking time', end_spell_checking - end_predict, 'seconds')
+    timers.add('spell_checking', end_spell_checking - end_predict)
 
     list_outputs = []
     groups = temp_json["groups"]
@@ -2,7 +2,11 @@ import torch
 from torch.autograd import Function
 from torch.nn.modules.utils import _pair
 
-from .. import deform_conv_cuda
+try:
+    from .. import deform_conv_cuda
+except ImportError:  # extension not built, deform_conv_torch is used instead
+    deform_conv_cuda = None
+from .deform_conv_torch import deform_conv_torch, modulated_deform_conv_torch
 
 
 class DeformConvFunction(Function):
@@ -177,5 +181,14 @@ class ModulatedDeformConvFunction(Function):
         return n, channels_out, height_out, width_out
 
 
-deform_conv = DeformConvFunction.apply
-modulated_deform_conv = ModulatedDeformConvFunction.apply
+def deform_conv(input, offset, weight, *args):
+    '''The cuda op for cuda tensors when it is built, else the pure PyTorch implementation.'''
+    if deform_conv_cuda is None or not input.is_cuda:
+        return deform_conv_torch(input, offset, weight, *args)
+    return DeformConvFunction.apply(input, offset, weight, *args)
+
+
+def modulated_deform_conv(input, offset, mask, weight, *args):
+    if deform_conv_cuda is None or not input.is_cuda:
+        return modulated_deform_conv_torch(input, offset, mask, weight, *args)
+    return ModulatedDeformConvFunction.apply(input, offset, mask, weight, *args)
@@ -0,0 +1,137 @@
+import torch
+import torch.nn.functional as F
+from torch.nn.modules.utils import _pair
+
+
+def deform_columns(input, offset, kernel_size, stride, padding, dilation,
+                   deformable_groups):
+    '''
+    Bilinear samples of input at the deformed kernel positions, the im2col
+    step of the cuda op: (n, channels, kh * kw, out_h, out_w). As in
+    deformable_im2col, offset holds one (dy, dx) pair per kernel position and
+    deformable group, and points outside the image read zeros.
+    '''
+    n, channels, height, width = input.shape
+    kernel_h, kernel_w = kernel_size
+    out_h, out_w = offset.shape[2:]
+    kernel = kernel_h * kernel_w
+    offset = offset.view(n, deformable_groups, kernel, 2, out_h, out_w)
+
+    ys = torch.arange(out_h, dtype=input.dtype, device=input.device)
+    xs = torch.arange(out_w, dtype=input.dtype, device=input.device)
+    ky = torch.arange(kernel_h, dtype=input.dtype, device=input.device)
+    kx = torch.arange(kernel_w, dtype=input.dtype, device=input.device)
+    base_y = (ky.view(-1, 1, 1, 1) * dilation[0] +
+              ys.view(1, 1, -1, 1) * stride[0] - padding[0])
+    base_x = (kx.view(1, -1, 1, 1) * dilation[1] +
+              xs.view(1, 1, 1, -1) * stride[1] - padding[1])
+    base_y = base_y.expand(kernel_h, kernel_w, out_h, out_w).reshape(
+        kernel, out_h, out_w)
+    base_x = base_x.expand(kernel_h, kernel_w, out_h, out_w).reshape(
+        kernel, out_h, out_w)
+    y = base_y + offset[:, :, :, 0]
+    x = base_x + offset[:, :, :, 1]
+
+    # pixel centres in the normalized coordinates of align_corners=False
+    grid = torch.stack(((2 * x + 1) / width - 1, (2 * y + 1) / height - 1),
+                       dim=-1)
+    grid = grid.view(n * deformable_groups, kernel * out_h, out_w, 2)
+    columns = F.grid_sample(
+        input.reshape(n * deformable_groups, channels // deformable_groups,
+                      height, width),
+        grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+    return columns.view(n, channels, kernel, out_h, out_w)
+
+
+def conv_columns(columns, weight, groups):
+    n, channels, kernel, out_h, out_w = columns.shape
+    out_channels = weight.size(0)
+    columns = columns.reshape(n, groups, channels // groups * kernel,
+                              out_h * out_w)
+    weight = weight.reshape(groups, out_channels // groups, -1)
+    return torch.matmul(weight, columns).view(n, out_channels, out_h, out_w)
+
+
+def output_size(input, weight, stride, padding, dilation):
+    size = []
+    for d in range(2):
+        kernel = dilation[d] * (weight.size(d + 2) - 1) + 1
+        size.append((input.size(d + 2) + 2 * padding[d] - kernel) //
+                    stride[d] + 1)
+    return tuple(size)
+
+
+def deform_conv_torch(input,
+                      offset,
+                      weight,
+                      stride=1,
+                      padding=0,
+                      dilation=1,
+                      groups=1,
+                      deformable_groups=1,
+                      im2col_step=64):
+    '''
+    Pure PyTorch deform_conv: runs on cpu, or on gpu without the compiled
+    extension, and supports autograd. The batch is processed im2col_step
+    images at a time to bound the memory of the sampled columns.
+    '''
+    if input.dim() != 4:
+        raise ValueError(
+            "Expected 4D tensor as input, got {}D tensor instead.".format(
+                input.dim()))
+    stride, padding, dilation = _pair(stride), _pair(padding), _pair(dilation)
+    if offset.shape[2:] != output_size(input, weight, stride, padding,
+                                       dilation):
+        raise ValueError('offset size {} does not match the output size'.format(
+            tuple(offset.shape)))
+    outputs = []
+    for begin in range(0, input.size(0), im2col_step):
+        end = begin + im2col_step
+        columns = deform_columns(input[begin:end], offset[begin:end],
+                                 weight.shape[2:], stride, padding, dilation,
+                                 deformable_groups)
+        outputs.append(conv_columns(columns, weight, groups))
+    return torch.cat(outputs) if len(outputs) > 1 else outputs[0]
+
+
+def modulated_deform_conv_torch(input,
+                                offset,
+                                mask,
+                                weight,
+                                bias=None,
+                                stride=1,
+                                padding=0,
+                                dilation=1,
+                                groups=1,
+                                deformable_groups=1,
+                                im2col_step=64):
+    '''
+    Pure PyTorch modulated_deform_conv (DCNv2), see deform_conv_torch.
+    mask: (n, deformable_groups * kh * kw, out_h, out_w) modulation scalars.
+    '''
+    if input.dim() != 4:
+        raise ValueError(
+            "Expected 4D tensor as input, got {}D tensor instead.".format(
+                input.dim()))
+    stride, padding, dilation = _pair(stride), _pair(padding), _pair(dilation)
+    if offset.shape[2:] != output_size(input, weight, stride, padding,
+                                       dilation):
+        raise ValueError('offset size {} does not match the output size'.format(
+            tuple(offset.shape)))
+    kernel = weight.size(2) * weight.size(3)
+    outputs = []
+    for begin in range(0, input.size(0), im2col_step):
+        end = begin + im2col_step
+        columns = deform_columns(input[begin:end], offset[begin:end],
+                                 weight.shape[2:], stride, padding, dilation,
+                                 deformable_groups)
+        n, channels, _, out_h, out_w = columns.shape
+        columns = columns.view(n, deformable_groups, -1, kernel, out_h, out_w)
+        columns = columns * mask[begin:end].view(n, deformable_groups, 1,
+                                                 kernel, out_h, out_w)
+        outputs.append(conv_columns(
+            columns.view(n, channels, kernel, out_h, out_w), weight, groups))
+    output = torch.cat(outputs) if len(outputs) > 1 else outputs[0]
+    if bias is not None:
+        output = output + bias.view(1, -1, 1, 1)
+    return output
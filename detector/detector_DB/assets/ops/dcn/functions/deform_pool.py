@@ -1,7 +1,10 @@
 import torch
 from torch.autograd import Function
 
-from .. import deform_pool_cuda
+try:
+    from .. import deform_pool_cuda
+except ImportError:  # extension not built, deformable pooling is cuda only
+    deform_pool_cuda = None
 
 
 class DeformRoIPoolingFunction(Function):
@@ -29,7 +32,7 @@ class DeformRoIPoolingFunction(Function):
         ctx.trans_std = trans_std
 
         assert 0.0 <= ctx.trans_std <= 1.0
-        if not data.is_cuda:
+        if deform_pool_cuda is None or not data.is_cuda:
             raise NotImplementedError
 
         n = rois.shape[0]
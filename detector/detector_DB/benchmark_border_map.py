@@ -0,0 +1,53 @@
+#!python3
+import argparse
+import time
+import numpy as np
+from data.processes.make_border_map import MakeBorderMap
+
+image_size = 640
+num_samples = 50
+polygons_per_sample = 10
+vertices_per_side = 8  # 2 * vertices_per_side vertices per polygon, Total-Text has up to ~15 per side
+
+
+def curved_polygon(rng, num_points, size):
+    center = rng.uniform(0.25 * size, 0.75 * size, 2)
+    radius, thickness = rng.uniform(0.1 * size, 0.25 * size), rng.uniform(10, 40)
+    angles = np.linspace(0, rng.uniform(0.5, 2.5), num_points) + rng.uniform(0, np.pi)
+    outer = center + radius * np.stack([np.cos(angles), -np.sin(angles)], 1)
+    inner = center + (radius - thickness) * np.stack([np.cos(angles[::-1]), -np.sin(angles[::-1])], 1)
+    return np.concatenate([outer, inner]).round()
+
+
+def make_samples(num_samples, num_polygons, num_points, size, seed=0):
+    rng = np.random.RandomState(seed)
+    return [[curved_polygon(rng, num_points, size) for _ in range(num_polygons)] for _ in range(num_samples)]
+
+
+def samples_per_second(process, samples, size):
+    image = np.zeros((size, size, 3), np.uint8)
+    begin = time.time()
+    for polygons in samples:
+        process.process({'image': image, 'polygons': [polygon.copy() for polygon in polygons],
+                         'ignore_tags': [False] * len(polygons)})
+    return len(samples) / (time.time() - begin)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MakeBorderMap samples per second of one data loader worker')
+    parser.add_argument('--image_size', type=int, default=image_size)
+    parser.add_argument('--samples', type=int, default=num_samples)
+    parser.add_argument('--polygons', type=int, default=polygons_per_sample)
+    parser.add_argument('--vertices', type=int, default=vertices_per_side, help='vertices per polygon side')
+    args = parser.parse_args()
+
+    samples = make_samples(args.samples, args.polygons, args.vertices, args.image_size)
+    loop = samples_per_second(MakeBorderMap(fast_distance=False), samples, args.image_size)
+    fast = samples_per_second(MakeBorderMap(), samples, args.image_size)
+    print('%d polygons of %d vertices on %dx%d images' % (args.polygons, 2 * args.vertices,
+                                                         args.image_size, args.image_size))
+    print('per edge loop: %.1f samples/s, fast_distance: %.1f samples/s (%.2fx)' % (loop, fast, fast / loop))
+
+
+if __name__ == '__main__':
+    main()
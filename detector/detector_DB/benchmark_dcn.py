@@ -0,0 +1,60 @@
+#!python3
+import argparse
+import time
+import torch
+import torch.nn as nn
+from assets.ops.dcn import ModulatedDeformConv
+from backbones.resnet import resnet18, deformable_resnet18
+
+img_short_side = 736
+num_runs = 10
+
+
+def benchmark(function, *inputs, runs=num_runs):
+    '''Mean milliseconds of function(*inputs) over runs calls, after one warm up call.'''
+    with torch.no_grad():
+        function(*inputs)
+        begin = time.time()
+        for _ in range(runs):
+            function(*inputs)
+    return (time.time() - begin) / runs * 1000
+
+
+def benchmark_layers(size, runs=num_runs):
+    '''The 3x3 convs of the deformable stages of deformable_resnet18, at their feature map sizes.'''
+    print('%-24s %10s %12s %8s' % ('layer', 'conv ms', 'dcn ms', 'ratio'))
+    for channels, stride in ((128, 8), (256, 16), (512, 32)):
+        input = torch.rand(1, channels, size[0] // stride, size[1] // stride)
+        conv = nn.Conv2d(channels, channels, 3, padding=1, bias=False).eval()
+        dcn = ModulatedDeformConv(channels, channels, 3, padding=1, bias=False).eval()
+        offset = torch.randn(1, 18, input.size(2), input.size(3))
+        mask = torch.rand(1, 9, input.size(2), input.size(3))
+        conv_time = benchmark(conv, input, runs=runs)
+        dcn_time = benchmark(dcn, input, offset, mask, runs=runs)
+        print('%-24s %10.2f %12.2f %8.2f' % ('%d x %d x %d' % tuple(input.shape[1:]),
+                                             conv_time, dcn_time, dcn_time / conv_time))
+
+
+def benchmark_backbones(size, runs=num_runs):
+    image = torch.rand(1, 3, size[0], size[1])
+    plain = benchmark(resnet18(pretrained=False).eval(), image, runs=runs)
+    deformable = benchmark(deformable_resnet18(pretrained=False).eval(), image, runs=runs)
+    print('resnet18 %.1f ms, deformable_resnet18 %.1f ms (%.2fx) for a %d x %d image' % (
+        plain, deformable, deformable / plain, size[0], size[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU speed of the pure PyTorch deformable convolution')
+    parser.add_argument('--image_short_side', type=int, default=img_short_side)
+    parser.add_argument('--runs', type=int, default=num_runs)
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    size = (args.image_short_side, args.image_short_side * 4 // 3 // 32 * 32)  # a 3:4 page
+    benchmark_layers(size, args.runs)
+    benchmark_backbones(size, args.runs)
+
+
+if __name__ == '__main__':
+    main()
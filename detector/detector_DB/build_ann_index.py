@@ -0,0 +1,29 @@
+#!python3
+import argparse
+import sys
+import time
+from data.annotation_index import AnnotationIndex
+from data.image_dataset import ImageDataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the gt files of an ImageDataset into the memory-mapped '
+                                                 'annotation index read with ann_index: True')
+    parser.add_argument('--data_dir', nargs='+', required=True)
+    parser.add_argument('--data_list', nargs='+', required=True, help='one list file per data_dir')
+    parser.add_argument('--output', type=str,
+                        help='index path, defaults to the first list file + .annidx, set ann_index_path to match')
+    args = parser.parse_args()
+
+    begin = time.time()
+    dataset = ImageDataset(data_dir=args.data_dir, data_list=args.data_list, ann_index=True,
+                           ann_index_path=args.output)
+    if not isinstance(dataset.targets, AnnotationIndex):
+        print('The annotation index could not be written')
+        sys.exit(1)
+    print('Indexed', len(dataset.targets), 'samples into', dataset.targets.path, 'in',
+          round(time.time() - begin, 2), 'seconds')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,12 +5,134 @@ import numpy as np
 from shapely.geometry import Polygon
 
 
+def polygon_bounds(polygons):
+    '''(n, 4) xmin, ymin, xmax, ymax of shapely polygons.'''
+    return np.array([polygon.bounds for polygon in polygons], dtype=np.float64).reshape(-1, 4)
+
+
+def bounds_overlap(bounds_1, bounds_2):
+    '''(n1, n2) boolean matrix of the pairs of boxes that overlap or touch.'''
+    return (bounds_1[:, None, 0] <= bounds_2[None, :, 2]) & (bounds_2[None, :, 0] <= bounds_1[:, None, 2]) & \
+        (bounds_1[:, None, 1] <= bounds_2[None, :, 3]) & (bounds_2[None, :, 1] <= bounds_1[:, None, 3])
+
+
 class DetectionIoUEvaluator(object):
-    def __init__(self, iou_constraint=0.5, area_precision_constraint=0.5):
+    def __init__(self, iou_constraint=0.5, area_precision_constraint=0.5, fast=True):
         self.iou_constraint = iou_constraint
         self.area_precision_constraint = area_precision_constraint
+        self.fast = fast
 
     def evaluate_image(self, gt, pred):
+        if self.fast:
+            return self.evaluate_image_fast(gt, pred)
+        return self.evaluate_image_reference(gt, pred)
+
+    def evaluate_image_fast(self, gt, pred):
+        '''
+        Same metrics as evaluate_image_reference. Every polygon is built once, and the exact intersection
+        is only computed for the gt / detection pairs whose bounding boxes overlap, the IoU of the others is 0.
+        '''
+        evaluationLog = ""
+        gtPols, gtShapes, gtDontCarePolsNum = [], [], []
+        for n in range(len(gt)):
+            points = gt[n]['points']
+            shape = Polygon(points)
+            if not shape.is_valid or not shape.is_simple:
+                continue
+            gtPols.append(points)
+            gtShapes.append(shape)
+            if gt[n]['ignore']:
+                gtDontCarePolsNum.append(len(gtPols)-1)
+
+        evaluationLog += "GT polygons: " + str(len(gtPols)) + (" (" + str(len(
+            gtDontCarePolsNum)) + " don't care)\n" if len(gtDontCarePolsNum) > 0 else "\n")
+
+        gtBounds = polygon_bounds(gtShapes)
+        dontCareBounds = gtBounds[gtDontCarePolsNum]
+        detPols, detShapes, detDontCarePolsNum = [], [], []
+        for n in range(len(pred)):
+            points = pred[n]['points']
+            shape = Polygon(points)
+            if not shape.is_valid or not shape.is_simple:
+                continue
+            detPols.append(points)
+            detShapes.append(shape)
+            if len(gtDontCarePolsNum) > 0:
+                pdDimensions = shape.area
+                candidates = np.nonzero(bounds_overlap(dontCareBounds, polygon_bounds([shape]))[:, 0])[0]
+                for dontCarePol in candidates:
+                    intersected_area = gtShapes[gtDontCarePolsNum[dontCarePol]].intersection(shape).area
+                    precision = 0 if pdDimensions == 0 else intersected_area / pdDimensions
+                    if (precision > self.area_precision_constraint):
+                        detDontCarePolsNum.append(len(detPols)-1)
+                        break
+
+        evaluationLog += "DET polygons: " + str(len(detPols)) + (" (" + str(len(
+            detDontCarePolsNum)) + " don't care)\n" if len(detDontCarePolsNum) > 0 else "\n")
+
+        iouMat = np.empty([1, 1])
+        pairs = []
+        detMatched = 0
+        if len(gtPols) > 0 and len(detPols) > 0:
+            iouMat = np.zeros([len(gtPols), len(detPols)])
+            gtAreas = [shape.area for shape in gtShapes]
+            detAreas = [shape.area for shape in detShapes]
+            for gtNum, detNum in zip(*np.nonzero(bounds_overlap(gtBounds, polygon_bounds(detShapes)))):
+                intersection = gtShapes[gtNum].intersection(detShapes[detNum]).area
+                union = gtAreas[gtNum] + detAreas[detNum] - intersection
+                iouMat[gtNum, detNum] = 0 if union == 0 else intersection / union
+
+            # greedy matching in gt then detection order, as in evaluate_image_reference
+            detAvailable = np.ones(len(detPols), dtype=bool)
+            detAvailable[detDontCarePolsNum] = False
+            gtDontCare = set(gtDontCarePolsNum)
+            for gtNum in range(len(gtPols)):
+                if gtNum in gtDontCare:
+                    continue
+                candidates = np.nonzero(detAvailable & (iouMat[gtNum] > self.iou_constraint))[0]
+                if len(candidates) > 0:
+                    detNum = int(candidates[0])
+                    detAvailable[detNum] = False
+                    detMatched += 1
+                    pairs.append({'gt': gtNum, 'det': detNum})
+                    evaluationLog += "Match GT #" + \
+                        str(gtNum) + " with Det #" + str(detNum) + "\n"
+
+        return self.sample_metrics(gtPols, detPols, gtDontCarePolsNum, detDontCarePolsNum,
+                                   iouMat, pairs, detMatched, evaluationLog)
+
+    def sample_metrics(self, gtPols, detPols, gtDontCarePolsNum, detDontCarePolsNum,
+                       iouMat, pairs, detMatched, evaluationLog):
+        numGtCare = (len(gtPols) - len(gtDontCarePolsNum))
+        numDetCare = (len(detPols) - len(detDontCarePolsNum))
+        if numGtCare == 0:
+            recall = float(1)
+            precision = float(0) if numDetCare > 0 else float(1)
+        else:
+            recall = float(detMatched) / numGtCare
+            precision = 0 if numDetCare == 0 else float(
+                detMatched) / numDetCare
+
+        hmean = 0 if (precision + recall) == 0 else 2.0 * \
+            precision * recall / (precision + recall)
+
+        return {
+            'precision': precision,
+            'recall': recall,
+            'hmean': hmean,
+            'pairs': pairs,
+            'iouMat': [] if len(detPols) > 100 else iouMat.tolist(),
+            'gtPolPoints': gtPols,
+            'detPolPoints': detPols,
+            'gtCare': numGtCare,
+            'detCare': numDetCare,
+            'gtDontCare': gtDontCarePolsNum,
+            'detDontCare': detDontCarePolsNum,
+            'detMatched': detMatched,
+            'evaluationLog': evaluationLog
+        }
+
+    def evaluate_image_reference(self, gt, pred):
 
         def get_union(pD, pG):
             return Polygon(pD).union(Polygon(pG)).area
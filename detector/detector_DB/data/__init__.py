@@ -3,3 +3,4 @@ from .transform_data import TransformData
 from .random_crop_aug import RandomCropAug
 from .make_border_map import MakeBorderMap
 from .image_dataset import ImageDataset
+from .packed_shards import PackedShardDataset
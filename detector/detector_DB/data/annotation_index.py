@@ -0,0 +1,164 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+MAGIC = b'DBANNIDX'
+VERSION = 1
+ALIGNMENT = 64
+ARRAYS = ('line_offsets', 'point_offsets', 'points', 'ignore', 'text_offsets', 'texts')
+
+
+def parse_gt(gt_path, icdar=False):
+    '''
+    Lines of a ground truth file as (polygon, text): x1,y1,...,xn,yn,text per line,
+    only the first 4 points for icdar. A text of '1' is an ignored line, like '###'.
+    '''
+    lines = []
+    with open(gt_path, 'r') as reader:
+        for line in reader:
+            parts = line.strip().split(',')
+            label = parts[-1]
+            if label == '1':
+                label = '###'
+            line = [i.strip('\ufeff').strip('\xef\xbb\xbf') for i in parts]
+            if icdar:
+                poly = np.array(list(map(float, line[:8]))).reshape((-1, 2))
+            else:
+                num_points = (len(line) - 1) // 2 * 2
+                poly = np.array(list(map(float, line[:num_points]))).reshape((-1, 2))
+            lines.append((poly, label))
+    return lines
+
+
+def index_key(data_lists, **kwargs):
+    '''
+    What an index was built from: the path, size and modification time of the list files,
+    plus kwargs (e.g. data_dir). An index whose key differs is rebuilt.
+    '''
+    key = {'version': VERSION, 'lists': []}
+    for data_list in data_lists:
+        stat = os.stat(data_list)
+        key['lists'].append([os.path.abspath(data_list), stat.st_size, stat.st_mtime_ns])
+    key.update(kwargs)
+    return json.loads(json.dumps(key))
+
+
+def aligned(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def read_header(path):
+    with open(path, 'rb') as reader:
+        if reader.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Not an annotation index: ' + path)
+        size = int.from_bytes(reader.read(8), 'little')
+        header = json.loads(reader.read(size).decode('utf-8'))
+    header['data_start'] = aligned(len(MAGIC) + 8 + size)
+    return header
+
+
+def is_valid(path, key):
+    try:
+        return read_header(path)['key'] == key
+    except (OSError, ValueError):
+        return False
+
+
+def build_index(gt_paths, path, key, icdar=False):
+    '''
+    Parse every ground truth file once and write them to path: a json header followed by the flat arrays
+    line_offsets (sample -> lines), point_offsets (line -> points), points (float32 x, y), ignore flags,
+    text_offsets and the utf-8 texts. The file is written next to path and renamed, so that concurrent
+    builders (e.g. the ranks of a distributed run) never read a partial index.
+    '''
+    line_offsets, point_offsets, text_offsets = [0], [0], [0]
+    points, ignore, texts = [], [], []
+    for gt_path in gt_paths:
+        for poly, text in parse_gt(gt_path, icdar):
+            points.append(poly.astype(np.float32))
+            point_offsets.append(point_offsets[-1] + len(poly))
+            ignore.append(text == '###')
+            encoded = text.encode('utf-8')
+            texts.append(encoded)
+            text_offsets.append(text_offsets[-1] + len(encoded))
+        line_offsets.append(len(ignore))
+    arrays = {
+        'line_offsets': np.array(line_offsets, dtype=np.int64),
+        'point_offsets': np.array(point_offsets, dtype=np.int64),
+        'points': np.concatenate(points) if points else np.zeros((0, 2), np.float32),
+        'ignore': np.array(ignore, dtype=np.bool_),
+        'text_offsets': np.array(text_offsets, dtype=np.int64),
+        'texts': np.frombuffer(b''.join(texts), dtype=np.uint8),
+    }
+
+    header = {'key': key, 'num_samples': len(gt_paths), 'arrays': {}}
+    offset = 0
+    for name in ARRAYS:
+        header['arrays'][name] = {'dtype': arrays[name].dtype.str, 'shape': arrays[name].shape, 'offset': offset}
+        offset += aligned(arrays[name].nbytes)
+    encoded = json.dumps(header).encode('utf-8')
+    data_start = aligned(len(MAGIC) + 8 + len(encoded))
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as writer:
+            writer.write(MAGIC)
+            writer.write(len(encoded).to_bytes(8, 'little'))
+            writer.write(encoded)
+            for name in ARRAYS:
+                writer.seek(data_start + header['arrays'][name]['offset'])
+                writer.write(arrays[name].tobytes())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class AnnotationIndex:
+    '''
+    Ground truth of a dataset from an index written by build_index, indexed like the list returned by
+    ImageDataset.load_ann: index[i] is the list of {'poly': [[x, y], ...], 'text': str} of the i-th image.
+    The arrays are memory-mapped on the first access of each process, nothing is read at construction
+    and pickling (e.g. to the DataLoader workers) only copies the path.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.arrays = None
+
+    def open(self):
+        if self.arrays is None:
+            arrays = {}
+            for name, array in self.header['arrays'].items():
+                dtype, shape = np.dtype(array['dtype']), tuple(array['shape'])
+                if np.prod(shape) == 0:
+                    arrays[name] = np.zeros(shape, dtype)
+                else:
+                    arrays[name] = np.memmap(self.path, dtype=dtype, mode='r', shape=shape,
+                                             offset=self.header['data_start'] + array['offset'])
+            self.arrays = arrays
+        return self.arrays
+
+    def __len__(self):
+        return self.header['num_samples']
+
+    def __getitem__(self, index):
+        arrays = self.open()
+        point_offsets, text_offsets = arrays['point_offsets'], arrays['text_offsets']
+        lines = []
+        for line in range(arrays['line_offsets'][index], arrays['line_offsets'][index + 1]):
+            poly = arrays['points'][point_offsets[line]:point_offsets[line + 1]]
+            text = arrays['texts'][text_offsets[line]:text_offsets[line + 1]].tobytes().decode('utf-8')
+            lines.append({'poly': poly.astype(np.float64).tolist(), 'text': text})
+        return lines
+
+    def ignore_tags(self, index):
+        arrays = self.open()
+        return arrays['ignore'][arrays['line_offsets'][index]:arrays['line_offsets'][index + 1]].tolist()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['arrays'] = None
+        return state
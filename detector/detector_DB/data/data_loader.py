@@ -37,7 +37,15 @@ class DataLoader(Configurable, torch.utils.data.DataLoader):
             self.shuffle = self.is_train
         self.num_workers = cmd.get('num_workers', self.num_workers)
 
-        if cmd.get('distributed'):
+        if isinstance(self.dataset, torch.utils.data.IterableDataset):
+            # shuffles and splits itself between the ranks and workers, e.g. PackedShardDataset
+            torch.utils.data.DataLoader.__init__(
+                self, self.dataset,
+                batch_size=self.batch_size // cmd.get('num_gpus', 1) if cmd.get('distributed') else self.batch_size,
+                num_workers=self.num_workers, drop_last=self.drop_last,
+                pin_memory=not cmd.get('distributed'), collate_fn=self.collect_fn,
+                worker_init_fn=default_worker_init_fn)
+        elif cmd.get('distributed'):
             sampler = DistributedSampler(
                 self.dataset, shuffle=self.shuffle,
                 num_replicas=cmd['num_gpus'])
@@ -7,7 +7,7 @@ import cv2
 import numpy as np
 import glob
 from concern.config import Configurable, State
-import math
+from .annotation_index import AnnotationIndex, build_index, index_key, is_valid, parse_gt
 
 class ImageDataset(data.Dataset, Configurable):
     r'''Dataset reading from images.
@@ -18,6 +18,10 @@ class ImageDataset(data.Dataset, Configurable):
     data_dir = State()
     data_list = State()
     processes = State(default=[])
+    # opt-in: read the ground truth from a memory-mapped index (build it with build_ann_index.py),
+    # rebuilt when the list files change, the gt files are parsed instead when it cannot be written
+    ann_index = State(default=False)
+    ann_index_path = State(default=None)  # defaults to the first list file + '.annidx', e.g. a writable cache dir
 
     def __init__(self, data_dir=None, data_list=None, cmd={}, **kwargs):
         self.load_all(**kwargs)
@@ -51,7 +55,10 @@ class ImageDataset(data.Dataset, Configurable):
             self.image_paths += image_path
             self.gt_paths += gt_path
         self.num_samples = len(self.image_paths)
-        self.targets = self.load_ann()
+        if self.ann_index:
+            self.targets = self.load_ann_index()
+        else:
+            self.targets = self.load_ann()
         if self.is_training:
             assert len(self.image_paths) == len(self.targets)
 
@@ -59,25 +66,23 @@ class ImageDataset(data.Dataset, Configurable):
         res = []
         for gt in self.gt_paths:
             lines = []
-            reader = open(gt, 'r').readlines()
-            for line in reader:
-                item = {}
-                parts = line.strip().split(',')
-                label = parts[-1]
-                if label == '1':
-                    label = '###'
-                line = [i.strip('\ufeff').strip('\xef\xbb\xbf') for i in parts]
-                if 'icdar' in self.data_dir[0]:
-                    poly = np.array(list(map(float, line[:8]))).reshape((-1, 2)).tolist()
-                else:
-                    num_points = math.floor((len(line) - 1) / 2) * 2
-                    poly = np.array(list(map(float, line[:num_points]))).reshape((-1, 2)).tolist()
-                item['poly'] = poly
-                item['text'] = label
-                lines.append(item)
+            for poly, label in parse_gt(gt, icdar='icdar' in self.data_dir[0]):
+                lines.append({'poly': poly.tolist(), 'text': label})
             res.append(lines)
         return res
 
+    def load_ann_index(self):
+        path = self.ann_index_path or self.data_list[0] + '.annidx'
+        key = index_key(self.data_list, data_dir=list(self.data_dir), is_training=self.is_training)
+        if not is_valid(path, key):
+            print('Building the annotation index ' + path)
+            try:
+                build_index(self.gt_paths, path, key, icdar='icdar' in self.data_dir[0])
+            except OSError as e:
+                print('Cannot write the annotation index (%s), parsing the gt files instead' % e)
+                return self.load_ann()
+        return AnnotationIndex(path)
+
     def __getitem__(self, index, retry=0):
         if index >= self.num_samples:
             index = index % self.num_samples
@@ -0,0 +1,222 @@
+import json
+import mmap
+import os
+
+import cv2
+import numpy as np
+import torch
+import torch.utils.data as data
+
+from concern.config import Configurable, State, StateMeta
+
+MAGIC = b'DBSHARD1'
+FOOTER_SIZE = len(MAGIC) + 8
+
+
+class ShardWriter:
+    '''
+    Packs samples into <prefix>-00000.shard, <prefix>-00001.shard, ... of about shard_size bytes each.
+    A shard is the records back to back (encoded image bytes, then the json annotation), followed by a
+    (num_records, 3) int64 index of offset, image size and annotation size, the index offset and MAGIC.
+    close() writes <prefix>.json, the manifest read by PackedShardDataset.
+    '''
+    def __init__(self, prefix, shard_size=1 << 30, **meta):
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.meta = meta
+        self.shards = []
+        self.writer = None
+        directory = os.path.dirname(os.path.abspath(prefix))
+        os.makedirs(directory, exist_ok=True)
+
+    def open_shard(self):
+        path = '%s-%05d.shard' % (self.prefix, len(self.shards))
+        self.writer = open(path, 'wb')
+        self.index = []
+        self.shards.append({'path': os.path.basename(path), 'num_samples': 0})
+
+    def close_shard(self):
+        index_offset = self.writer.tell()
+        self.writer.write(np.array(self.index, dtype=np.int64).reshape(-1, 3).tobytes())
+        self.writer.write(index_offset.to_bytes(8, 'little'))
+        self.writer.write(MAGIC)
+        self.writer.close()
+        self.shards[-1]['num_samples'] = len(self.index)
+        self.writer = None
+
+    def write(self, filename, image_bytes, lines):
+        '''image_bytes: the encoded image file, lines: [{'poly': [[x, y], ...], 'text': str}, ...]'''
+        if self.writer is None:
+            self.open_shard()
+        annotation = json.dumps({'filename': filename, 'lines': lines}, ensure_ascii=False).encode('utf-8')
+        offset = self.writer.tell()
+        self.writer.write(image_bytes)
+        self.writer.write(annotation)
+        self.index.append((offset, len(image_bytes), len(annotation)))
+        if self.writer.tell() >= self.shard_size:
+            self.close_shard()
+
+    def close(self):
+        if self.writer is not None:
+            self.close_shard()
+        manifest = dict(self.meta, shards=self.shards, num_samples=sum(s['num_samples'] for s in self.shards))
+        with open(self.prefix + '.json', 'w') as writer:
+            json.dump(manifest, writer, indent=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ShardReader:
+    '''Memory-mapped shard, records read by index or sequentially in file order.'''
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[-len(MAGIC):] != MAGIC:
+            raise ValueError('Not a packed shard: ' + path)
+        index_offset = int.from_bytes(self.buffer[-FOOTER_SIZE:-len(MAGIC)], 'little')
+        self.index = np.frombuffer(self.buffer, dtype=np.int64, offset=index_offset,
+                                   count=(len(self.buffer) - FOOTER_SIZE - index_offset) // 8).reshape(-1, 3)
+
+    def advise_sequential(self):
+        if hasattr(self.buffer, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self.buffer.madvise(mmap.MADV_SEQUENTIAL)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        '''(encoded image bytes, annotation dict) of the i-th record.'''
+        offset, image_size, annotation_size = (int(value) for value in self.index[i])
+        image_bytes = self.buffer[offset:offset + image_size]
+        annotation = self.buffer[offset + image_size:offset + image_size + annotation_size]
+        return image_bytes, json.loads(annotation.decode('utf-8'))
+
+    def close(self):
+        self.index = None
+        self.buffer.close()
+        self.file.close()
+
+
+class IterableStateMeta(StateMeta, type(data.IterableDataset)):
+    pass
+
+
+class PackedShardDataset(data.IterableDataset, Configurable, metaclass=IterableStateMeta):
+    r'''Dataset reading the shards written by ShardWriter (pack_dataset.py).
+    Iterating reads every shard of this worker sequentially, shards in a random order, and shuffles the
+    samples through a buffer of buffer_size samples (0: file order). The shards are split between the
+    distributed ranks and the DataLoader workers. Only the manifest is read at construction.
+    Indexing gives random access, e.g. for evaluation.
+    Args:
+        Processes: A series of Callable object, which accept as parameter and return the data dict,
+            typically inherrited the `DataProcess`(data/processes/data_process.py) class.
+    '''
+    manifest = State()
+    processes = State(default=[])
+    buffer_size = State(default=256)
+    is_training = State(default=None)  # defaults to the value of the packed ImageDataset
+
+    def __init__(self, manifest=None, cmd={}, **kwargs):
+        self.load_all(**kwargs)
+        self.manifest = manifest or self.manifest
+        with open(self.manifest, 'r') as reader:
+            meta = json.load(reader)
+        directory = os.path.dirname(os.path.abspath(self.manifest))
+        self.shard_paths = [os.path.join(directory, shard['path']) for shard in meta['shards']]
+        self.shard_sizes = [shard['num_samples'] for shard in meta['shards']]
+        self.shard_starts = np.cumsum([0] + self.shard_sizes)
+        self.num_samples = meta['num_samples']
+        if self.is_training is None:
+            self.is_training = meta.get('is_training', True)
+        self.debug = cmd.get('debug', False)
+        self.epoch = 0
+        self.readers = {}
+
+    def reader(self, shard):
+        if shard not in self.readers:
+            self.readers[shard] = ShardReader(self.shard_paths[shard])
+        return self.readers[shard]
+
+    def make_data(self, image_bytes, annotation):
+        data = {}
+        image_path = annotation['filename']
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR).astype('float32')
+        if self.is_training:
+            data['filename'] = image_path
+            data['data_id'] = image_path
+        else:
+            data['filename'] = image_path.split('/')[-1]
+            data['data_id'] = image_path.split('/')[-1]
+        data['image'] = img
+        data['lines'] = annotation['lines']
+        if self.processes is not None:
+            for data_process in self.processes:
+                data = data_process(data)
+        return data
+
+    def __getitem__(self, index):
+        index = index % self.num_samples
+        shard = int(np.searchsorted(self.shard_starts, index, side='right')) - 1
+        return self.make_data(*self.reader(shard)[index - self.shard_starts[shard]])
+
+    def partition(self):
+        '''Position and count of this process among all the (rank, DataLoader worker) readers.'''
+        rank, world_size = 0, 1
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            rank, world_size = torch.distributed.get_rank(), torch.distributed.get_world_size()
+        worker = data.get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+        return rank * num_workers + worker_id, world_size * num_workers
+
+    def set_epoch(self, epoch):
+        '''Seed of the shard order, the same in every rank and worker so that they split the same permutation.'''
+        self.epoch = epoch
+
+    def records(self):
+        '''(shard, record) pairs of this reader, each shard in file order.'''
+        reader_id, num_readers = self.partition()
+        shards = np.arange(len(self.shard_paths))
+        if self.is_training:
+            np.random.RandomState(self.epoch).shuffle(shards)
+        if len(shards) >= num_readers:
+            for shard in shards[reader_id::num_readers]:
+                self.reader(shard).advise_sequential()
+                for i in range(self.shard_sizes[shard]):
+                    yield shard, i
+        else:  # fewer shards than readers, split the records instead
+            for shard in shards:
+                self.reader(shard).advise_sequential()
+                first = (reader_id - self.shard_starts[shard]) % num_readers
+                for i in range(first, self.shard_sizes[shard], num_readers):
+                    yield shard, i
+
+    def __iter__(self):
+        # torch seeds every worker of every epoch differently
+        rng = np.random.RandomState(torch.initial_seed() % 2 ** 32)
+        buffer_size = self.buffer_size if self.is_training else 0
+        buffer = []
+        for shard, i in self.records():
+            item = self.reader(shard)[i]
+            if buffer_size <= 0:
+                yield self.make_data(*item)
+                continue
+            buffer.append(item)
+            if len(buffer) >= buffer_size:
+                j = rng.randint(len(buffer))
+                buffer[j], buffer[-1] = buffer[-1], buffer[j]
+                yield self.make_data(*buffer.pop())
+        rng.shuffle(buffer)
+        for item in buffer:
+            yield self.make_data(*item)
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['readers'] = {}
+        return state
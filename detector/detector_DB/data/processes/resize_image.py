@@ -1,3 +1,5 @@
+import math
+
 import cv2
 import numpy as np
 
@@ -6,6 +8,13 @@ import concern.webcv2 as webcv2
 from .data_process import DataProcess
 
 
+def short_side_size(height, width, short_side):
+    '''(height, width) of an image resized to short_side, the long side rounded up to a multiple of 32.'''
+    if height < width:
+        return short_side, int(math.ceil(short_side / height * width / 32) * 32)
+    return int(math.ceil(short_side / width * height / 32) * 32), short_side
+
+
 class _ResizeImage:
     '''
     Resize images.
@@ -4,10 +4,11 @@ import os
 import torch
 import cv2
 import numpy as np
-import math, time
+import time
 from structure.model import SegDetectorModel
 from structure.representers.seg_detector_representer import SegDetectorRepresenter
 from structure.visualizers.seg_detector_visualizer import SegDetectorVisualizer
+from data.processes.resize_image import short_side_size
 
 img_path = '../../datasets/detector/invoices_7May/imgs_crop/val/350.jpg'
 detector_model = 'model_epoch_428_minibatch_9000'
@@ -84,12 +85,7 @@ class Demo:
 
     def resize_image(self, img):
         height, width, _ = img.shape
-        if height < width:
-            new_height = self.args['image_short_side']
-            new_width = int(math.ceil(new_height / height * width / 32) * 32)
-        else:
-            new_width = self.args['image_short_side']
-            new_height = int(math.ceil(new_width / width * height / 32) * 32)
+        new_height, new_width = short_side_size(height, width, self.args['image_short_side'])
         resized_img = cv2.resize(img, (new_width, new_height))
         return resized_img
 
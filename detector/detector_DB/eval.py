@@ -1,6 +1,9 @@
 #!python3
 import argparse
+import json
 import os
+import platform
+import cv2
 import torch
 import yaml
 from tqdm import tqdm
@@ -11,6 +14,8 @@ from experiment import Structure, TrainSettings, ValidationSettings, Experiment
 from concern.log import Logger
 from data.data_loader import DataLoader
 from data.image_dataset import ImageDataset
+from data.processes import NormalizeImage, ResizeImage
+from data.processes.resize_image import short_side_size
 from training.checkpoint import Checkpoint
 from training.learning_rate import (
     ConstantLearningRate, PriorityLearningRate, FileMonitorLearningRate
@@ -20,6 +25,36 @@ from training.optimizer_scheduler import OptimizerScheduler
 from concern.config import Configurable, Config
 import time
 
+# --benchmark defaults
+benchmark_sides = [736]
+benchmark_batch_sizes = [1]
+benchmark_warmup = 5
+benchmark_runs = 50
+benchmark_stages = ['decode', 'preprocess', 'forward', 'represent']
+
+
+def reset_peak_rss():
+    '''Reset the peak RSS (VmHWM) of this process, linux only. Returns whether it was reset.'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as writer:
+            writer.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_rss_mb(field='VmRSS'):
+    '''VmRSS (current) or VmHWM (peak) of this process in MB, None if /proc is not available.'''
+    try:
+        with open('/proc/self/status', 'r') as reader:
+            for line in reader:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024.
+    except OSError:
+        pass
+    return None
+
+
 def main():
     parser = argparse.ArgumentParser(description='Text Recognition Training')
     parser.add_argument('exp', type=str)
@@ -39,6 +74,8 @@ def main():
                         help='The threshold to replace it in the representers')
     parser.add_argument('--box_thresh', type=float, default=0.6,
                         help='The threshold to replace it in the representers')
+    parser.add_argument('--measure_workers', type=int,
+                        help='processes evaluating the detections of the images, 0 to evaluate them inline')
     parser.add_argument('--verbose', action='store_true',
                         help='show verbose info')
     parser.add_argument('--no-verbose', action='store_true',
@@ -53,6 +90,18 @@ def main():
                         help='Show iamges eagerly')
     parser.add_argument('--speed', action='store_true', dest='test_speed',
                         help='Test speed only')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time decode, forward and represent over a sweep of image sizes and batch sizes')
+    parser.add_argument('--benchmark_sides', type=int, nargs='+', default=benchmark_sides,
+                        help='image_short_side values of the benchmark')
+    parser.add_argument('--benchmark_batch_sizes', type=int, nargs='+', default=benchmark_batch_sizes)
+    parser.add_argument('--benchmark_warmup', type=int, default=benchmark_warmup,
+                        help='untimed batches before each benchmark setting')
+    parser.add_argument('--benchmark_runs', type=int, default=benchmark_runs,
+                        help='timed batches of each benchmark setting')
+    parser.add_argument('--benchmark_report', type=str,
+                        help='json report of the benchmark, defaults to <result_dir>/benchmark.json')
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
     parser.add_argument('--dest', type=str,
                         help='Specify which prediction will be used for decoding.')
     parser.add_argument('--debug', action='store_true', dest='debug',
@@ -76,7 +125,12 @@ def main():
     experiment_args.update(cmd=args)
     experiment = Configurable.construct_class_from_config(experiment_args)
 
-    Eval(experiment, experiment_args, cmd=args, verbose=args['verbose']).eval(args['visualize'])
+    if args.get('threads'):
+        torch.set_num_threads(args['threads'])
+    if args['benchmark']:
+        Eval(experiment, experiment_args, cmd=args, verbose=args['verbose']).benchmark()
+    else:
+        Eval(experiment, experiment_args, cmd=args, verbose=args['verbose']).eval(args['visualize'])
 
 
 class Eval:
@@ -133,6 +187,123 @@ class Eval:
         
         return time_cost
         
+    def synchronize(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize()
+
+    def benchmark_paths(self):
+        for data_loader in self.data_loaders.values():
+            image_paths = getattr(data_loader.dataset, 'image_paths', None)
+            if image_paths:
+                return image_paths
+        raise ValueError('The benchmark reads the image files of an ImageDataset, none is configured')
+
+    def load_benchmark_batch(self, image_paths, short_side):
+        '''
+        Read and decode image_paths and resize them to one batch, sized after the first image as in demo.py,
+        with the ResizeImage and NormalizeImage processes of the datasets.
+        Returns the batch and the decode and preprocess seconds.
+        '''
+        start = time.time()
+        images = [cv2.imread(image_path, cv2.IMREAD_COLOR) for image_path in image_paths]
+        decode_time = time.time() - start
+
+        start = time.time()
+        resize = ResizeImage(mode='resize', image_size=list(short_side_size(*images[0].shape[:2], short_side)))
+        normalize = NormalizeImage()
+        tensors = [normalize.process(resize.process({'image': image.astype('float32')}))['image']
+                   for image in images]
+        batch = {'image': torch.stack(tensors), 'shape': [image.shape[:2] for image in images],
+                 'filename': list(image_paths)}
+        return batch, decode_time, time.time() - start
+
+    def benchmark_setting(self, model, image_paths, short_side, batch_size, warmup, runs):
+        '''Milliseconds of every stage over runs batches, after warmup untimed ones.'''
+        times = {stage: [] for stage in benchmark_stages}
+        rss_start = read_rss_mb()
+        peak_reset = reset_peak_rss()
+        if self.device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats()
+        for run in range(warmup + runs):
+            first = run * batch_size
+            batch_paths = [image_paths[(first + i) % len(image_paths)] for i in range(batch_size)]
+            batch, decode_time, preprocess_time = self.load_benchmark_batch(batch_paths, short_side)
+            self.synchronize()
+            start = time.time()
+            pred = model.forward(batch, training=False)
+            self.synchronize()
+            forward_time = time.time() - start
+            start = time.time()
+            self.structure.representer.represent(batch, pred, is_output_polygon=self.args.get('polygon', False))
+            represent_time = time.time() - start
+            if run >= warmup:
+                for stage, seconds in zip(benchmark_stages, (decode_time, preprocess_time, forward_time,
+                                                             represent_time)):
+                    times[stage].append(seconds * 1000)
+
+        result = {'image_short_side': short_side, 'batch_size': batch_size, 'warmup': warmup, 'runs': runs,
+                  'image_size': list(batch['image'].shape[2:])}
+        for stage in benchmark_stages:
+            values = np.array(times[stage])
+            result[stage] = {'mean_ms': float(values.mean()), 'p50_ms': float(np.percentile(values, 50)),
+                             'p95_ms': float(np.percentile(values, 95)), 'p99_ms': float(np.percentile(values, 99))}
+        total = sum(result[stage]['mean_ms'] for stage in benchmark_stages)
+        result['images_per_second'] = batch_size * 1000. / total
+        # the peak is reset before every setting, so it covers this setting only (None without /proc)
+        result['rss_start_mb'] = rss_start
+        result['peak_rss_mb'] = read_rss_mb('VmHWM') if peak_reset else None
+        if self.device.type == 'cuda':
+            result['peak_cuda_mb'] = torch.cuda.max_memory_allocated() / 2 ** 20
+        return result
+
+    def benchmark(self):
+        '''
+        Time decode, preprocess, forward and represent separately for every image_short_side x batch size
+        of the sweep, log p50 / p95 / p99 and write them with the settings and the hardware to a json report.
+        '''
+        self.init_torch_tensor()
+        model = self.init_model()
+        self.resume(model, self.model_path)
+        model.eval()
+        image_paths = self.benchmark_paths()
+        warmup = self.args.get('benchmark_warmup', benchmark_warmup)
+        runs = self.args.get('benchmark_runs', benchmark_runs)
+        results = []
+        with torch.no_grad():
+            for short_side in self.args.get('benchmark_sides', benchmark_sides):
+                for batch_size in self.args.get('benchmark_batch_sizes', benchmark_batch_sizes):
+                    result = self.benchmark_setting(model, image_paths, short_side, batch_size, warmup, runs)
+                    results.append(result)
+                    peak_rss = '%.0f' % result['peak_rss_mb'] if result['peak_rss_mb'] is not None else '-'
+                    self.logger.info('side %d, batch %d: %s, %.2f images/s, setting peak rss %s MB' % (
+                        short_side, batch_size, ', '.join('%s p50 %.1f / p95 %.1f / p99 %.1f ms' % (
+                            stage, result[stage]['p50_ms'], result[stage]['p95_ms'], result[stage]['p99_ms'])
+                            for stage in benchmark_stages),
+                        result['images_per_second'], peak_rss))
+
+        report = {
+            'checkpoint': self.model_path,
+            'exp': self.args.get('exp'),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'device': str(self.device),
+            'cuda_device': torch.cuda.get_device_name() if self.device.type == 'cuda' else None,
+            'threads': torch.get_num_threads(),
+            'cpu_count': os.cpu_count(),
+            'processor': platform.processor() or platform.machine(),
+            'platform': platform.platform(),
+            'torch': torch.__version__,
+            'num_images': len(image_paths),
+            'results': results,
+        }
+        report_path = self.args.get('benchmark_report') or os.path.join(
+            self.args.get('result_dir', './results/'), 'benchmark.json')
+        if os.path.dirname(report_path):
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, 'w') as writer:
+            json.dump(report, writer, indent=1)
+        self.logger.info('Benchmark report: ' + report_path)
+        return report
+
     def format_output(self, batch, output):
         batch_boxes, batch_scores = output
         for index in range(batch['image'].size(0)):
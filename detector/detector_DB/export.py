@@ -0,0 +1,141 @@
+#!python3
+import argparse
+import os
+import time
+import torch
+import torch.nn as nn
+from structure.model import SegDetectorModel
+
+ckpt_path = '../detector_DB_train/outputs/train_2020-04-28_22-54/model/model_epoch_571_minibatch_12000'
+img_short_side = 736
+scripted_ext = '.torchscript'
+onnx_ext = '.onnx'
+onnx_opset = 11
+
+
+def fuse_conv_bn(conv, bn):
+    '''
+    Fold an eval mode BatchNorm2d into the preceding Conv2d / ConvTranspose2d, returns the fused conv.
+    '''
+    fused = type(conv)(conv.in_channels, conv.out_channels, conv.kernel_size, stride=conv.stride,
+                       padding=conv.padding, dilation=conv.dilation, groups=conv.groups, bias=True)
+    if isinstance(conv, nn.ConvTranspose2d):
+        fused.output_padding = conv.output_padding
+    scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias.detach() if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    weight = conv.weight.detach()
+    if isinstance(conv, nn.ConvTranspose2d):  # weight: (in, out, k, k)
+        weight = weight * scale.view(1, -1, 1, 1)
+    else:  # weight: (out, in / groups, k, k)
+        weight = weight * scale.view(-1, 1, 1, 1)
+    fused.weight.data.copy_(weight)
+    fused.bias.data.copy_((bias - bn.running_mean) * scale + bn.bias.detach())
+    return fused
+
+
+def is_fusable(conv, bn):
+    if isinstance(conv, nn.ConvTranspose2d) and conv.groups != 1:
+        return False
+    return type(conv) in (nn.Conv2d, nn.ConvTranspose2d) and isinstance(bn, nn.BatchNorm2d) \
+        and bn.track_running_stats and bn.affine
+
+
+def fuse_modules(module):
+    '''
+    Fold every BatchNorm2d into its conv, in place: conv -> bn pairs of nn.Sequential and the
+    convN / bnN attributes of the resnet blocks. Deformable convs are left as they are.
+    '''
+    for child in module.children():
+        fuse_modules(child)
+    if isinstance(module, nn.Sequential):
+        names = list(module._modules.keys())
+        for name, next_name in zip(names[:-1], names[1:]):
+            if is_fusable(module._modules[name], module._modules[next_name]):
+                module._modules[name] = fuse_conv_bn(module._modules[name], module._modules[next_name])
+                module._modules[next_name] = nn.Identity()
+    for index in ('1', '2', '3'):
+        conv, bn = getattr(module, 'conv' + index, None), getattr(module, 'bn' + index, None)
+        if conv is not None and bn is not None and is_fusable(conv, bn):
+            setattr(module, 'conv' + index, fuse_conv_bn(conv, bn))
+            setattr(module, 'bn' + index, nn.Identity())
+    return module
+
+
+class InferenceModel(nn.Module):
+    '''
+    backbone + decoder of a trained BasicModel, image tensor in, probability map out. The loss and the
+    threshold branch (only used for training) are dropped and the batch norms are folded into the convs.
+    The modules of model are modified in place, pass a copy to keep using it for training.
+    '''
+    def __init__(self, model):
+        super(InferenceModel, self).__init__()
+        if isinstance(model, SegDetectorModel):
+            model = model.model
+        self.backbone = model.backbone
+        self.decoder = model.decoder
+        if hasattr(self.decoder, 'thresh'):
+            del self.decoder.thresh
+            self.decoder.adaptive = False
+        self.eval()
+        fuse_modules(self)
+
+    def forward(self, image):
+        return self.decoder(self.backbone(image))
+
+
+def export(model, output_path, image_size=(img_short_side, img_short_side)):
+    '''
+    Trace and freeze the inference graph of a SegDetectorModel, loadable with torch.jit.load.
+    Input sizes other than image_size work as long as both sides are multiples of 32.
+    '''
+    model = InferenceModel(model).cpu()
+    example = torch.zeros(1, 3, image_size[0], image_size[1])
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        if hasattr(torch.jit, 'freeze'):
+            traced = torch.jit.freeze(traced)
+    torch.jit.save(traced, output_path)
+    return traced
+
+
+def export_onnx(model, output_path, image_size=(img_short_side, img_short_side), opset=onnx_opset):
+    '''
+    Export the inference graph of a SegDetectorModel to ONNX with dynamic batch, height and width,
+    e.g. for onnxruntime (utils/onnx_backend.py). Both sides of the input must be multiples of 32.
+    '''
+    model = InferenceModel(model).cpu()
+    example = torch.zeros(1, 3, image_size[0], image_size[1])
+    with torch.no_grad():
+        torch.onnx.export(model, example, output_path, input_names=['image'], output_names=['binary'],
+                          dynamic_axes={'image': {0: 'batch', 2: 'height', 3: 'width'},
+                                        'binary': {0: 'batch', 2: 'height', 3: 'width'}},
+                          opset_version=opset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a DB detector checkpoint to frozen TorchScript or ONNX')
+    parser.add_argument('--resume', type=str, help='Checkpoint to export', default=ckpt_path)
+    parser.add_argument('--backbone', choices=['resnet18', 'deformable_resnet18'], default='resnet18')
+    parser.add_argument('--format', choices=['torchscript', 'onnx'], default='torchscript')
+    parser.add_argument('--output', type=str, help='Defaults to the checkpoint path + %s or %s' % (
+        scripted_ext, onnx_ext))
+    parser.add_argument('--image_short_side', type=int, default=img_short_side,
+                        help='side of the example image used for tracing')
+    args = parser.parse_args()
+    output = args.output or args.resume + (onnx_ext if args.format == 'onnx' else scripted_ext)
+
+    model = SegDetectorModel(torch.device('cpu'), backbone=args.backbone)
+    states = torch.load(args.resume, map_location='cpu')
+    model.load_state_dict(states, strict=False)
+    model.eval()
+    begin = time.time()
+    if args.format == 'onnx':
+        export_onnx(model, output, (args.image_short_side, args.image_short_side))
+    else:
+        export(model, output, (args.image_short_side, args.image_short_side))
+    print('Exported', output, 'in', round(time.time() - begin, 2), 'seconds,',
+          round(os.path.getsize(output) / 2 ** 20, 2), 'MB')
+
+
+if __name__ == '__main__':
+    main()
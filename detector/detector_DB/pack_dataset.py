@@ -0,0 +1,40 @@
+#!python3
+import argparse
+import time
+from data.image_dataset import ImageDataset
+from data.packed_shards import ShardWriter
+
+shard_size_mb = 1024
+
+
+def pack(dataset, prefix, shard_size=shard_size_mb << 20):
+    '''
+    Write the images (the encoded files, as they are) and the ground truth of an ImageDataset to packed shards,
+    in list order. Returns the number of samples.
+    '''
+    with ShardWriter(prefix, shard_size, is_training=dataset.is_training) as writer:
+        for index, image_path in enumerate(dataset.image_paths):
+            with open(image_path, 'rb') as reader:
+                image_bytes = reader.read()
+            writer.write(image_path, image_bytes, dataset.targets[index])
+    return len(dataset.image_paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack the images and gts of an ImageDataset into shards '
+                                                 'for PackedShardDataset')
+    parser.add_argument('--data_dir', nargs='+', required=True)
+    parser.add_argument('--data_list', nargs='+', required=True, help='one list file per data_dir')
+    parser.add_argument('--output', required=True,
+                        help='shard prefix, writes <output>-00000.shard, ... and the manifest <output>.json')
+    parser.add_argument('--shard_size', type=int, default=shard_size_mb, help='MB per shard')
+    args = parser.parse_args()
+
+    dataset = ImageDataset(data_dir=args.data_dir, data_list=args.data_list, ann_index=False)
+    begin = time.time()
+    num_samples = pack(dataset, args.output, args.shard_size << 20)
+    print('Packed', num_samples, 'samples into', args.output + '.json', 'in', round(time.time() - begin, 2), 'seconds')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,34 @@
+import multiprocessing
+
 import numpy as np
 
 from concern import Logger, AverageMeter
-from concern.config import Configurable
+from concern.config import Configurable, State
 from concern.icdar2015_eval.detection.iou import DetectionIoUEvaluator
 
 
 class QuadMeasurer(Configurable):
-    def __init__(self, **kwargs):
+    # processes evaluating the images, 0: in the calling process. With workers, measure returns
+    # an AsyncResult right away and gather_measure waits for it, so the evaluation overlaps inference.
+    # For eval.py (--measure_workers) only: trainer.validate_step unpacks the result of validate_measure.
+    num_workers = State(default=0)
+
+    def __init__(self, cmd={}, **kwargs):
+        self.load_all(**kwargs)
+        self.num_workers = cmd.get('measure_workers', self.num_workers)
         self.evaluator = DetectionIoUEvaluator()
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.num_workers)
+        return self.pool
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
 
     def measure(self, batch, output, is_output_polygon=False, box_thresh=0.6):
         '''
@@ -20,7 +41,7 @@ class QuadMeasurer(Configurable):
             filename: the original filenames of images.
         output: (polygons, ...)
         '''
-        results = []
+        gts, preds = [], []
         gt_polyons_batch = batch['polygons']
         ignore_tags_batch = batch['ignore_tags']
         pred_polygons_batch = np.array(output[0])
@@ -40,8 +61,11 @@ class QuadMeasurer(Configurable):
                         # print(pred_polygons[i,:,:].tolist())
                         pred.append(dict(points=pred_polygons[i,:,:].tolist()))
                 # pred = [dict(points=pred_polygons[i,:,:].tolist()) if pred_scores[i] >= box_thresh for i in range(pred_polygons.shape[0])]
-            results.append(self.evaluator.evaluate_image(gt, pred))
-        return results
+            gts.append(gt)
+            preds.append(pred)
+        if self.num_workers > 0:
+            return self.get_pool().starmap_async(self.evaluator.evaluate_image, zip(gts, preds))
+        return [self.evaluator.evaluate_image(gt, pred) for gt, pred in zip(gts, preds)]
 
     def validate_measure(self, batch, output, is_output_polygon=False, box_thresh=0.6):
         return self.measure(batch, output, is_output_polygon, box_thresh)
@@ -53,7 +77,8 @@ class QuadMeasurer(Configurable):
     def gather_measure(self, raw_metrics, logger: Logger):
         raw_metrics = [image_metrics
                        for batch_metrics in raw_metrics
-                       for image_metrics in batch_metrics]
+                       for image_metrics in (batch_metrics.get() if hasattr(batch_metrics, 'get') else batch_metrics)]
+        self.close_pool()
 
         result = self.evaluator.combine_results(raw_metrics)
 
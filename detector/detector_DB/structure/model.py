@@ -9,12 +9,12 @@ import decoders
 
 
 class BasicModel(nn.Module):
-    def __init__(self):
+    def __init__(self, backbone='resnet18'):
         nn.Module.__init__(self)
 
-        from backbones.resnet import resnet18, deformable_resnet18
-        #self.backbone = getattr(backbones, args['backbone'])(**args.get('backbone_args', {}))
-        self.backbone = resnet18()
+        import backbones
+        # deformable_resnet18 runs on cpu too, see assets/ops/dcn/functions/deform_conv_torch.py
+        self.backbone = getattr(backbones, backbone)()
         from decoders.seg_detector import SegDetector
         self.decoder = SegDetector(adaptive=True, k =50, in_channels = [64,128,256,512])
         #self.decoder = getattr(decoders, args['decoder'])(**args.get('decoder_args', {}))
@@ -34,11 +34,11 @@ def parallelize(model, distributed, local_rank):
         return nn.DataParallel(model)
 
 class SegDetectorModel(nn.Module):
-    def __init__(self, device, distributed: bool = False, local_rank: int = 0):
+    def __init__(self, device, distributed: bool = False, local_rank: int = 0, backbone='resnet18'):
         super(SegDetectorModel, self).__init__()
         from decoders.seg_detector_loss import SegDetectorLossBuilder
 
-        self.model = BasicModel()
+        self.model = BasicModel(backbone)
         self.criterion = SegDetectorLossBuilder('L1BalanceCELoss').build()
         # for loading models
         # if device.type !='cpu':
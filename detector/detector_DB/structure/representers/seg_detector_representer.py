@@ -1,3 +1,6 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from shapely.geometry import Polygon
@@ -9,6 +12,17 @@ class SegDetectorRepresenter(Configurable):
     box_thresh = State(default=0.01)
     max_candidates = State(default=1000)
     dest = State(default='binary')
+    # 'box': mean probability inside every box, one mask per contour.
+    # 'label': mean probability of every connected component of the binarized map, computed in a single pass.
+    # The whole component is averaged instead of the shrunk box, so label scores run higher than box scores
+    # and box_thresh has to be recalibrated (e.g. on the validation set) when switching to 'label'.
+    score_mode = State(default='box')
+    # expand the rectangles analytically instead of offsetting them with pyclipper, rectangle outputs only
+    fast_unclip = State(default=True)
+    # score boxes on the probability map downsampled by this factor, 'box' score mode only
+    score_scale = State(default=1.0)
+    # threads post-processing the images of a batch, 0 for one per core
+    workers = State(default=1)
 
     def __init__(self, cmd={}, **kwargs):
         self.load_all(**kwargs)
@@ -22,8 +36,19 @@ class SegDetectorRepresenter(Configurable):
             self.box_thresh = cmd['box_thresh']
         if 'dest' in cmd:
             self.dest = cmd['dest']
+        if 'score_mode' in cmd:
+            self.score_mode = cmd['score_mode']
+        if 'fast_unclip' in cmd:
+            self.fast_unclip = cmd['fast_unclip']
+        if 'score_scale' in cmd:
+            self.score_scale = cmd['score_scale']
+        if 'workers' in cmd:
+            self.workers = cmd['workers']
+        self.buffers = threading.local()
+        self.pool = None
+        self.pool_lock = threading.Lock()
 
-    def represent(self, batch, _pred, is_output_polygon=False):
+    def represent(self, batch, _pred, is_output_polygon=False, min_size=None):
         '''
         batch: (image, polygons, ignore_tags
         batch: a dict produced by dataloaders.
@@ -32,36 +57,70 @@ class SegDetectorRepresenter(Configurable):
             ignore_tags: tensor of shape (N, K), indicates whether a region is ignorable or not.
             shape: the original shape of images.
             filename: the original filenames of images.
+            valid_shape: [optional] the (H, W) of each image inside a padded batch,
+                the padded area of the prediction is cropped off before representing.
         pred:
             binary: text region segmentation map, with shape (N, 1, H, W)
             thresh: [if exists] thresh hold prediction with shape (N, 1, H, W)
             thresh_binary: [if exists] binarized with threshhold, (N, 1, H, W)
+        min_size: smallest box side kept, in pixels of pred, self.min_size by default.
         '''
         images = batch['image']
         if isinstance(_pred, dict):
             pred = _pred[self.dest]
         else:
             pred = _pred
-        segmentation = self.binarize(pred)
-        boxes_batch = []
-        scores_batch = []
-        for batch_index in range(images.size(0)):
+        pred = pred.detach().cpu().numpy()  # the only float map, a view when pred is on cpu
+
+        def represent_image(batch_index):
             height, width = batch['shape'][batch_index]
+            image_pred = pred[batch_index, 0]
+            if 'valid_shape' in batch:
+                valid_height, valid_width = batch['valid_shape'][batch_index]
+                image_pred = image_pred[:valid_height, :valid_width]
+            bitmap = self.threshold_map(image_pred)
             if is_output_polygon:
-                boxes, scores = self.polygons_from_bitmap(
-                    pred[batch_index],
-                    segmentation[batch_index], width, height)
-            else:
-                boxes, scores = self.boxes_from_bitmap(
-                    pred[batch_index],
-                    segmentation[batch_index], width, height)
-            boxes_batch.append(boxes)
-            scores_batch.append(scores)
+                return self.polygons_from_map(
+                    image_pred, bitmap, width, height, min_size)
+            return self.boxes_from_map(
+                image_pred, bitmap, width, height, min_size)
+
+        # cv2 releases the GIL, the images of a batch are post-processed in parallel
+        if self.workers != 1 and images.size(0) > 1:
+            outputs = list(self.get_pool().map(represent_image, range(images.size(0))))
+        else:
+            outputs = [represent_image(batch_index) for batch_index in range(images.size(0))]
+        boxes_batch = [boxes for boxes, _ in outputs]
+        scores_batch = [scores for _, scores in outputs]
         return boxes_batch, scores_batch
+
+    def get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(self.workers or os.cpu_count() or 1)
+            return self.pool
     
     def binarize(self, pred):
         return pred > self.thresh
 
+    def threshold_map(self, pred):
+        '''
+        Binarize the (H, W) float map pred to a {0, 1} uint8 map in one pass.
+        The result lives in a buffer of the calling thread, reused (overwritten) by the next call.
+        '''
+        buffer = getattr(self.buffers, 'bitmap', None)
+        if buffer is None or buffer.size < pred.size:
+            buffer = np.empty(pred.size, dtype=np.uint8)
+            self.buffers.bitmap = buffer
+        bitmap = buffer[:pred.size].reshape(pred.shape)
+        np.greater(pred, self.thresh, out=bitmap.view(np.bool_))
+        return bitmap
+
+    def score_map(self, pred):
+        if self.score_scale == 1:
+            return pred
+        return cv2.resize(pred, None, fx=self.score_scale, fy=self.score_scale, interpolation=cv2.INTER_AREA)
+
     def polygons_from_bitmap(self, pred, _bitmap, dest_width, dest_height):
         '''
         _bitmap: single map with shape (1, H, W),
@@ -69,15 +128,25 @@ class SegDetectorRepresenter(Configurable):
         '''
 
         assert _bitmap.size(0) == 1
-        bitmap = _bitmap.cpu().numpy()[0]  # The first channel
+        bitmap = _bitmap.cpu().numpy()[0].astype(np.uint8)  # The first channel
         pred = pred.cpu().detach().numpy()[0]
+        return self.polygons_from_map(pred, bitmap, dest_width, dest_height)
+
+    def polygons_from_map(self, pred, bitmap, dest_width, dest_height, min_size=None):
+        '''
+        pred: (H, W) float probability map, bitmap: (H, W) uint8 map, nonzero on text.
+        '''
+        min_size = self.min_size if min_size is None else min_size
         height, width = bitmap.shape
         boxes = []
         scores = []
 
         (contours,_) = cv2.findContours(
-            (bitmap*255).astype(np.uint8),
-            cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            bitmap, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        if self.score_mode == 'label':
+            labels, label_scores = self.component_scores(pred, bitmap)
+        else:
+            score_pred = self.score_map(pred)
 
         for contour in contours[:self.max_candidates]:
             epsilon = 0.01 * cv2.arcLength(contour, True)
@@ -88,7 +157,10 @@ class SegDetectorRepresenter(Configurable):
             # _, sside = self.get_mini_boxes(contour)
             # if sside < self.min_size:
             #     continue
-            score = self.box_score_fast(pred, points.reshape(-1, 2))
+            if self.score_mode == 'label':
+                score = label_scores[labels[contour[0, 0, 1], contour[0, 0, 0]]]
+            else:
+                score = self.box_score_fast(score_pred, points.reshape(-1, 2) * self.score_scale)
             if self.box_thresh > score:
                 continue
             
@@ -100,7 +172,7 @@ class SegDetectorRepresenter(Configurable):
                 continue
             box = box.reshape(-1, 2)
             _, sside = self.get_mini_boxes(box.reshape((-1, 1, 2)))
-            if sside < self.min_size + 2:
+            if sside < min_size + 2:
                 continue
 
             if not isinstance(dest_width, int):
@@ -122,29 +194,46 @@ class SegDetectorRepresenter(Configurable):
         '''
         
         assert _bitmap.size(0) == 1
-        bitmap = _bitmap.cpu().numpy()[0]  # The first channel
+        bitmap = _bitmap.cpu().numpy()[0].astype(np.uint8)  # The first channel
         pred = pred.cpu().detach().numpy()[0]
+        return self.boxes_from_map(pred, bitmap, dest_width, dest_height)
+
+    def boxes_from_map(self, pred, bitmap, dest_width, dest_height, min_size=None):
+        '''
+        pred: (H, W) float probability map, bitmap: (H, W) uint8 map, nonzero on text.
+        '''
+        min_size = self.min_size if min_size is None else min_size
         height, width = bitmap.shape
         contours, _ = cv2.findContours(
-            (bitmap*255).astype(np.uint8),
-            cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            bitmap, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        if self.score_mode == 'label':
+            labels, label_scores = self.component_scores(pred, bitmap)
+        else:
+            score_pred = self.score_map(pred)
         num_contours = min(len(contours), self.max_candidates)
         boxes = np.zeros((num_contours, 4, 2), dtype=np.int16)
         scores = np.zeros((num_contours,), dtype=np.float32)
 
         for index in range(num_contours):
             contour = contours[index]
-            points, sside = self.get_mini_boxes(contour)
-            if sside < self.min_size:
+            bounding_box = cv2.minAreaRect(contour)
+            points, sside = self.order_box_points(bounding_box)
+            if sside < min_size:
                 continue
             points = np.array(points)
-            score = self.box_score_fast(pred, points.reshape(-1, 2))
+            if self.score_mode == 'label':
+                score = label_scores[labels[contour[0, 0, 1], contour[0, 0, 0]]]
+            else:
+                score = self.box_score_fast(score_pred, points.reshape(-1, 2) * self.score_scale)
             if self.box_thresh > score:
                 continue
         
-            box = self.unclip(points).reshape(-1, 1, 2)
-            box, sside = self.get_mini_boxes(box)
-            if sside < self.min_size + 2:
+            if self.fast_unclip:
+                box, sside = self.order_box_points(self.unclip_rect(bounding_box))
+            else:
+                box = self.unclip(points).reshape(-1, 1, 2)
+                box, sside = self.get_mini_boxes(box)
+            if sside < min_size + 2:
                 continue
             box = np.array(box)
             if not isinstance(dest_width, int):
@@ -167,8 +256,19 @@ class SegDetectorRepresenter(Configurable):
         expanded = np.array(offset.Execute(distance))
         return expanded
 
+    def unclip_rect(self, rect, unclip_ratio=1.5):
+        '''
+        Same expansion as unclip for a rotated rectangle ((cx, cy), (w, h), angle): the round offset of a
+        rectangle by distance d has the rectangle (w + 2d, h + 2d) as minimum area box.
+        '''
+        center, (w, h), angle = rect
+        distance = w * h * unclip_ratio / (2 * (w + h))
+        return center, (w + 2 * distance, h + 2 * distance), angle
+
     def get_mini_boxes(self, contour):
-        bounding_box = cv2.minAreaRect(contour)
+        return self.order_box_points(cv2.minAreaRect(contour))
+
+    def order_box_points(self, bounding_box):
         points = sorted(list(cv2.boxPoints(bounding_box)), key=lambda x: x[0])
 
         index_1, index_2, index_3, index_4 = 0, 1, 2, 3
@@ -189,6 +289,19 @@ class SegDetectorRepresenter(Configurable):
                points[index_3], points[index_4]]
         return box, min(bounding_box[1])
 
+    def component_scores(self, pred, bitmap):
+        '''
+        Label the binarized map once and average pred over every connected component.
+        Returns the label map and the score of every label; a contour gets the score of the
+        component its first point lies on (contour points are always foreground pixels).
+        '''
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(bitmap, connectivity=8)
+        sums = np.zeros(num_labels)
+        for begin in range(0, labels.shape[0], 256):  # in row blocks, bincount copies the weights to float64
+            sums += np.bincount(labels[begin:begin + 256].ravel(), weights=pred[begin:begin + 256].ravel(),
+                                minlength=num_labels)
+        return labels, sums / np.maximum(stats[:, cv2.CC_STAT_AREA], 1)
+
     def box_score_fast(self, bitmap, _box):
         h, w = bitmap.shape[:2]
         box = _box.copy()
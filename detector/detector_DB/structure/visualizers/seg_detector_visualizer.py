@@ -93,7 +93,10 @@ class SegDetectorVisualizer(Configurable):
     def demo_visualize(self, image_path, output):
         boxes, _ = output
         boxes = boxes[0]
-        original_image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if isinstance(image_path, np.ndarray):
+            original_image = image_path
+        else:
+            original_image = cv2.imread(image_path, cv2.IMREAD_COLOR)
         original_shape = original_image.shape
         pred_canvas = original_image.copy().astype(np.uint8)
         pred_canvas = cv2.resize(pred_canvas, (original_shape[1], original_shape[0]))
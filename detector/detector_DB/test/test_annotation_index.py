@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+import unittest
+origin_path = sys.path
+sys.path.append("..")
+from data.image_dataset import ImageDataset
+sys.path = origin_path
+
+
+def write_dataset(root, num_images):
+    os.makedirs(os.path.join(root, 'train_gts'))
+    with open(os.path.join(root, 'train_list.txt'), 'w') as writer:
+        for i in range(num_images):
+            writer.write('img_%d.jpg\n' % i)
+            with open(os.path.join(root, 'train_gts', 'img_%d.txt' % i), 'w', encoding='utf-8') as gt:
+                gt.write('\ufeff10,20,110,20,110,50,10,50,Hóa đơn %d\n' % i)
+                gt.write('1.5,2,30,2.25,30,9,25,12,1,9,###\n')
+                if i % 2:
+                    gt.write('0,0,4,0,4,4,0,4,1\n')
+    return os.path.join(root, 'train_list.txt')
+
+
+class annotationIndexTestCase(unittest.TestCase):
+
+    def checkIndex(self):
+        root = tempfile.mkdtemp()
+        data_list = write_dataset(root, 5)
+        dataset = ImageDataset(data_dir=[root], data_list=[data_list], ann_index=False)
+        indexed = ImageDataset(data_dir=[root], data_list=[data_list], ann_index=True)
+        assert os.path.exists(data_list + '.annidx')
+        assert len(indexed.targets) == 5
+        assert [indexed.targets[i] for i in range(5)] == dataset.targets
+        assert indexed.targets.ignore_tags(1) == [False, True, True]
+        unpickled = pickle.loads(pickle.dumps(indexed.targets))
+        assert unpickled.arrays is None and unpickled[3] == dataset.targets[3]
+
+        # a changed list file is indexed again
+        modified = os.path.getmtime(data_list)
+        write_dataset(os.path.join(root, 'more'), 7)
+        os.replace(os.path.join(root, 'more', 'train_list.txt'), data_list)
+        for i in range(7):
+            os.replace(os.path.join(root, 'more', 'train_gts', 'img_%d.txt' % i),
+                       os.path.join(root, 'train_gts', 'img_%d.txt' % i))
+        os.utime(data_list, (time.time(), modified + 1))
+        indexed = ImageDataset(data_dir=[root], data_list=[data_list], ann_index=True)
+        assert len(indexed.targets) == 7
+        assert indexed.targets[6] == ImageDataset(data_dir=[root], data_list=[data_list], ann_index=False).targets[6]
+
+        # an index that cannot be written falls back to parsing the gt files
+        unwritable = os.path.join(root, 'missing', 'train.annidx')
+        dataset = ImageDataset(data_dir=[root], data_list=[data_list], ann_index=True, ann_index_path=unwritable)
+        assert isinstance(dataset.targets, list) and len(dataset.targets) == 7
+        assert not os.path.exists(os.path.dirname(unwritable))
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(annotationIndexTestCase("checkIndex"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import sys
+import unittest
+import numpy as np
+from shapely.geometry import Point, Polygon
+origin_path = sys.path
+sys.path.append("..")
+from data.processes.make_border_map import MakeBorderMap
+sys.path = origin_path
+
+
+def curved_polygon(rng, num_points):
+    '''Total-Text like arc: num_points vertices on the outer side, as many on the inner side.'''
+    center, radius, thickness = rng.uniform(150, 250, 2), rng.uniform(60, 120), rng.uniform(10, 30)
+    angles = np.linspace(0, rng.uniform(1, 2.5), num_points) + rng.uniform(0, np.pi)
+    outer = center + radius * np.stack([np.cos(angles), -np.sin(angles)], 1)
+    inner = center + (radius - thickness) * np.stack([np.cos(angles[::-1]), -np.sin(angles[::-1])], 1)
+    return np.concatenate([outer, inner]).round()
+
+
+def thresh_map(process, polygons, shape=(400, 400, 3)):
+    data = {'image': np.zeros(shape, np.uint8), 'polygons': [p.copy() for p in polygons],
+            'ignore_tags': [False] * len(polygons)}
+    return process.process(data)['thresh_map']
+
+
+class borderMapTestCase(unittest.TestCase):
+
+    def checkQuads(self):
+        polygons = [np.array([[20, 30], [300, 40], [298, 90], [18, 80]], np.float64),
+                    np.array([[200, 200], [380, 150], [390, 190], [210, 240]], np.float64)]
+        fast = thresh_map(MakeBorderMap(), polygons)
+        loop = thresh_map(MakeBorderMap(fast_distance=False), polygons)
+        # the loop is exact along the edges, and a little off beyond the corners
+        assert np.abs(fast - loop).max() < 0.03
+        assert np.abs(fast - loop).mean() < 1e-4
+
+    def checkCurved(self):
+        rng = np.random.RandomState(0)
+        polygons = [curved_polygon(rng, 8) for _ in range(4)]
+        process = MakeBorderMap()
+        fast = thresh_map(process, polygons)
+        loop = thresh_map(MakeBorderMap(fast_distance=False), polygons)
+        # the loop overestimates the distance to short edges, elsewhere both agree
+        assert np.abs(fast - loop).mean() < 1e-3
+        assert (fast - loop).min() > -1e-4
+        for y, x in zip(rng.randint(0, 400, 200), rng.randint(0, 400, 200)):
+            target = process.thresh_min
+            for polygon in polygons:
+                shape = Polygon(polygon)
+                padding = shape.area * (1 - process.shrink_ratio ** 2) / shape.length
+                distance = shape.exterior.distance(Point(x, y))
+                if distance < padding and Polygon(shape.buffer(padding)).contains(Point(x, y)):
+                    target = max(target, process.thresh_min + (process.thresh_max - process.thresh_min) *
+                                 (1 - distance / padding))
+            assert abs(fast[y, x] - target) < 0.02
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(borderMapTestCase("checkQuads"))
+    suite.addTest(borderMapTestCase("checkCurved"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import sys
+import unittest
+import numpy as np
+import torch
+import torch.nn.functional as F
+origin_path = sys.path
+sys.path.append("..")
+from assets.ops.dcn import ModulatedDeformConv, deform_conv, modulated_deform_conv
+sys.path = origin_path
+
+
+def bilinear(image, y, x):
+    '''deformable_im2col_bilinear of the cuda op: image (height, width), zero outside.'''
+    height, width = image.shape
+    if y <= -1 or y >= height or x <= -1 or x >= width:
+        return 0.
+    y0, x0 = int(np.floor(y)), int(np.floor(x))
+    value = 0.
+    for yi, wy in ((y0, 1 - (y - y0)), (y0 + 1, y - y0)):
+        for xi, wx in ((x0, 1 - (x - x0)), (x0 + 1, x - x0)):
+            if 0 <= yi < height and 0 <= xi < width:
+                value += wy * wx * image[yi, xi]
+    return value
+
+
+def reference(input, offset, mask, weight, stride, padding, dilation, groups, deformable_groups):
+    '''out[o, h, w] = sum_c,i,j weight[o, c, i, j] * mask * input[c](p0 + p_ij + offset), loop by loop.'''
+    input, offset, mask, weight = [t.double().numpy() for t in (input, offset, mask, weight)]
+    n, channels, _, _ = input.shape
+    out_channels, group_channels, kernel_h, kernel_w = weight.shape
+    out_h, out_w = offset.shape[2:]
+    output = np.zeros((n, out_channels, out_h, out_w))
+    for b in range(n):
+        for c in range(channels):
+            g = c // (channels // deformable_groups)
+            group = c // group_channels
+            for i in range(kernel_h):
+                for j in range(kernel_w):
+                    k = i * kernel_w + j
+                    for h in range(out_h):
+                        for w in range(out_w):
+                            y = h * stride - padding + i * dilation + offset[b, g * 2 * kernel_h * kernel_w + 2 * k, h, w]
+                            x = w * stride - padding + j * dilation + offset[b, g * 2 * kernel_h * kernel_w + 2 * k + 1, h, w]
+                            value = bilinear(input[b, c], y, x) * mask[b, g * kernel_h * kernel_w + k, h, w]
+                            outputs = range(group * (out_channels // groups), (group + 1) * (out_channels // groups))
+                            for o in outputs:
+                                output[b, o, h, w] += weight[o, c % group_channels, i, j] * value
+    return output
+
+
+class dcnTestCase(unittest.TestCase):
+
+    def checkZeroOffset(self):
+        torch.manual_seed(0)
+        input = torch.rand(2, 8, 11, 13)
+        weight = torch.rand(6, 4, 3, 3)
+        offset = torch.zeros(2, 2 * 2 * 9, 6, 7)
+        output = deform_conv(input, offset, weight, 2, 1, 1, 2, 2)
+        target = F.conv2d(input, weight, stride=2, padding=1, groups=2)
+        assert (output - target).abs().max() < 1e-4
+
+    def checkReference(self):
+        torch.manual_seed(0)
+        for stride, padding, dilation, groups, deformable_groups in [(1, 1, 1, 1, 1), (2, 2, 2, 2, 2)]:
+            input = torch.rand(2, 4, 7, 9)
+            weight = torch.rand(4, 4 // groups, 3, 3) - 0.5
+            out_h = (7 + 2 * padding - 2 * dilation - 1) // stride + 1
+            out_w = (9 + 2 * padding - 2 * dilation - 1) // stride + 1
+            # large offsets, to also sample outside the image
+            offset = (torch.rand(2, deformable_groups * 18, out_h, out_w) - 0.5) * 6
+            mask = torch.rand(2, deformable_groups * 9, out_h, out_w)
+            target = reference(input, offset, torch.ones_like(mask), weight, stride, padding, dilation,
+                               groups, deformable_groups)
+            output = deform_conv(input, offset, weight, stride, padding, dilation, groups, deformable_groups)
+            assert np.abs(output.numpy() - target).max() < 1e-4
+            target = reference(input, offset, mask, weight, stride, padding, dilation, groups, deformable_groups)
+            output = modulated_deform_conv(input, offset, mask, weight, None, stride, padding, dilation,
+                                           groups, deformable_groups)
+            assert np.abs(output.numpy() - target).max() < 1e-4
+
+    def checkGradient(self):
+        torch.manual_seed(0)
+        layer = ModulatedDeformConv(3, 2, 3, padding=1).double()
+        input = torch.rand(1, 3, 5, 5, dtype=torch.double, requires_grad=True)
+        # offsets away from integer positions, where bilinear interpolation is not differentiable
+        offset = (torch.rand(1, 18, 5, 5, dtype=torch.double) * 0.8 + 0.1).requires_grad_()
+        mask = torch.rand(1, 9, 5, 5, dtype=torch.double, requires_grad=True)
+        assert torch.autograd.gradcheck(layer, (input, offset, mask))
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(dcnTestCase("checkZeroOffset"))
+    suite.addTest(dcnTestCase("checkReference"))
+    suite.addTest(dcnTestCase("checkGradient"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
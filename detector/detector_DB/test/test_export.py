@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+import torch
+import torch.nn as nn
+origin_path = sys.path
+sys.path.append("..")
+from export import InferenceModel, export_onnx
+from backbones.resnet import resnet18
+from decoders.seg_detector import SegDetector
+sys.path = origin_path
+
+
+class BasicModel(nn.Module):
+    '''The detector of structure.model, without the imagenet weights download.'''
+    def __init__(self):
+        nn.Module.__init__(self)
+        self.backbone = resnet18(pretrained=False)
+        self.decoder = SegDetector(adaptive=True, k=50, in_channels=[64, 128, 256, 512])
+
+
+def random_model():
+    torch.manual_seed(0)
+    model = BasicModel()
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.2, 0.2)
+    return model.eval()
+
+
+class exportTestCase(unittest.TestCase):
+
+    def checkInferenceModel(self):
+        model = random_model()
+        image = torch.rand(2, 3, 128, 192)
+        with torch.no_grad():
+            target = model.decoder(model.backbone(image))
+            fused = InferenceModel(model)
+            assert not any(isinstance(module, nn.BatchNorm2d) for module in fused.modules())
+            assert not hasattr(fused.decoder, 'thresh')
+            assert (fused(image) - target).abs().max() < 1e-4
+            traced = torch.jit.trace(fused, torch.zeros(1, 3, 64, 64))
+            assert (traced(image) - target).abs().max() < 1e-4
+
+    def checkOnnx(self):
+        import onnxruntime
+        model = random_model()
+        images = [torch.rand(2, 3, 128, 192), torch.rand(1, 3, 96, 64)]
+        with torch.no_grad():
+            targets = [model.decoder(model.backbone(image)).numpy() for image in images]
+        output_path = os.path.join(tempfile.mkdtemp(), 'detector.onnx')
+        export_onnx(model, output_path, image_size=(64, 64))
+        session = onnxruntime.InferenceSession(output_path, providers=['CPUExecutionProvider'])
+        for image, target in zip(images, targets):
+            result = session.run(None, {'image': image.numpy()})[0]
+            assert result.shape == target.shape
+            assert np.abs(result - target).max() < 1e-4
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(exportTestCase("checkInferenceModel"))
+    suite.addTest(exportTestCase("checkOnnx"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import sys
+import unittest
+import numpy as np
+origin_path = sys.path
+sys.path.append("..")
+from concern.icdar2015_eval.detection.iou import DetectionIoUEvaluator
+from structure.measurers.quad_measurer import QuadMeasurer
+sys.path = origin_path
+
+
+def random_quads(rng, num_quads, jitter=None, quads=None):
+    '''Rotated rectangles on a 1000x1000 page, or jittered copies of quads.'''
+    if quads is not None:
+        return [quad + rng.uniform(-jitter, jitter, quad.shape) for quad in quads]
+    result = []
+    for _ in range(num_quads):
+        center, size = rng.uniform(0, 1000, 2), rng.uniform([20, 8], [200, 40])
+        angle = rng.uniform(-0.3, 0.3)
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * size / 2
+        result.append(center + corners.dot(rotation.T))
+    return result
+
+
+def random_image(rng, num_gt=40):
+    gt_quads = random_quads(rng, num_gt)
+    pred_quads = random_quads(rng, None, jitter=8, quads=gt_quads[:num_gt * 3 // 4]) + random_quads(rng, 10)
+    gt = [dict(points=quad.tolist(), ignore=bool(rng.rand() < 0.1)) for quad in gt_quads]
+    # a self-intersecting polygon, skipped
+    gt.append(dict(points=[(0, 0), (10, 10), (10, 0), (0, 10)], ignore=False))
+    pred = [dict(points=quad.tolist()) for quad in pred_quads]
+    return gt, pred
+
+
+class iouTestCase(unittest.TestCase):
+
+    def checkFastEvaluator(self):
+        rng = np.random.RandomState(0)
+        fast, reference = DetectionIoUEvaluator(), DetectionIoUEvaluator(fast=False)
+        results = []
+        for _ in range(5):
+            gt, pred = random_image(rng)
+            result, target = fast.evaluate_image(gt, pred), reference.evaluate_image(gt, pred)
+            assert np.abs(np.array(result['iouMat']) - np.array(target['iouMat'])).max() < 1e-9
+            for key in ('pairs', 'gtDontCare', 'detDontCare', 'detMatched', 'precision', 'recall',
+                        'evaluationLog', 'gtPolPoints', 'detPolPoints'):
+                assert result[key] == target[key], key
+            results.append(result)
+        assert results[0]['detMatched'] > 0 and results[0]['detDontCare']
+
+    def checkMeasurerPool(self):
+        rng = np.random.RandomState(1)
+        images = [random_image(rng, 10) for _ in range(4)]
+        batch = {'polygons': [[np.array(line['points']) for line in gt] for gt, _ in images],
+                 'ignore_tags': [[line['ignore'] for line in gt] for gt, _ in images]}
+        boxes = np.array([[line['points'] for line in pred] for _, pred in images])
+        output = (boxes, np.ones(boxes.shape[:2]))
+        serial = QuadMeasurer().measure(batch, output)
+        measurer = QuadMeasurer(cmd={'measure_workers': 2})
+        pending = measurer.measure(batch, output)
+        assert [r['pairs'] for r in pending.get()] == [r['pairs'] for r in serial]
+        metrics = measurer.gather_measure([pending], None)
+        assert measurer.pool is None
+        assert metrics['recall'].avg == QuadMeasurer().gather_measure([serial], None)['recall'].avg
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(iouTestCase("checkFastEvaluator"))
+    suite.addTest(iouTestCase("checkMeasurerPool"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import os
+import sys
+import tempfile
+import unittest
+import cv2
+import numpy as np
+import torch.utils.data
+origin_path = sys.path
+sys.path.append("..")
+from data.image_dataset import ImageDataset
+from data.packed_shards import PackedShardDataset
+from pack_dataset import pack
+sys.path = origin_path
+
+
+def write_dataset(root, num_images):
+    os.makedirs(os.path.join(root, 'train_images'))
+    os.makedirs(os.path.join(root, 'train_gts'))
+    rng = np.random.RandomState(0)
+    with open(os.path.join(root, 'train_list.txt'), 'w') as writer:
+        for i in range(num_images):
+            writer.write('img_%d.png\n' % i)
+            image = rng.randint(0, 256, (32 + i, 48, 3)).astype(np.uint8)
+            cv2.imwrite(os.path.join(root, 'train_images', 'img_%d.png' % i), image)
+            with open(os.path.join(root, 'train_gts', 'img_%d.txt' % i), 'w', encoding='utf-8') as gt:
+                gt.write('1,2,30,2,30,20,1,20,Tổng %d\n' % i)
+                gt.write('5,5,9,5,9,9,5,9,###\n')
+    return os.path.join(root, 'train_list.txt')
+
+
+def collate(batch):
+    return batch
+
+
+class packedShardsTestCase(unittest.TestCase):
+
+    def checkPackedShards(self):
+        root = tempfile.mkdtemp()
+        data_list = write_dataset(root, 12)
+        dataset = ImageDataset(data_dir=[root], data_list=[data_list], ann_index=False)
+        prefix = os.path.join(root, 'shards', 'train')
+        # small shards, a few samples each
+        assert pack(dataset, prefix, shard_size=10000) == 12
+        packed = PackedShardDataset(manifest=prefix + '.json', buffer_size=4)
+        assert len(packed.shard_paths) > 2 and len(packed) == 12
+
+        for index in (0, 5, 11):
+            target, item = dataset[index], packed[index]
+            assert item['filename'] == target['filename'] and item['lines'] == target['lines']
+            assert np.array_equal(item['image'], target['image'])
+
+        seen = [item['filename'] for item in packed]
+        assert sorted(seen) == sorted(dataset.image_paths) and seen != dataset.image_paths
+        loader = torch.utils.data.DataLoader(packed, batch_size=2, num_workers=2, collate_fn=collate)
+        seen = [item['filename'] for batch in loader for item in batch]
+        assert sorted(seen) == sorted(dataset.image_paths)
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(packedShardsTestCase("checkPackedShards"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
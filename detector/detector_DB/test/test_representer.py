@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import sys
+import unittest
+import cv2
+import numpy as np
+import torch
+origin_path = sys.path
+sys.path.append("..")
+from structure.representers.seg_detector_representer import SegDetectorRepresenter
+sys.path = origin_path
+
+
+def random_pred(height=320, width=480, num_boxes=60, seed=0):
+    '''Probability map with rotated text-line like rectangles.'''
+    rng = np.random.RandomState(seed)
+    pred = np.zeros((height, width), dtype=np.float32)
+    for _ in range(num_boxes):
+        rect = ((rng.uniform(0, width), rng.uniform(0, height)),
+                (rng.uniform(6, 80), rng.uniform(3, 14)), rng.uniform(-30, 30))
+        points = cv2.boxPoints(rect).astype(np.int32)
+        cv2.fillPoly(pred, [points], float(rng.uniform(0.4, 0.95)))
+    return torch.from_numpy(pred)[None]
+
+
+class representerTestCase(unittest.TestCase):
+
+    def checkFastUnclip(self):
+        for seed in range(5):
+            pred = random_pred(seed=seed)
+            bitmap = pred > 0.3
+            exact = SegDetectorRepresenter(cmd={'fast_unclip': False})
+            fast = SegDetectorRepresenter(cmd={'fast_unclip': True})
+            exact_boxes, exact_scores = exact.boxes_from_bitmap(pred, bitmap, 960, 640)
+            fast_boxes, fast_scores = fast.boxes_from_bitmap(pred, bitmap, 960, 640)
+            assert exact_boxes.shape == fast_boxes.shape
+            assert np.array_equal(exact_scores, fast_scores)
+            # pyclipper works on integer coordinates, the analytic box is within a few pixels (2x scale)
+            diff = np.abs(exact_boxes.astype(np.int32) - fast_boxes.astype(np.int32))
+            assert diff.max() <= 4
+            assert diff.mean() < 1.5
+
+    def checkRepresentMap(self):
+        pred = random_pred(seed=1)
+        batch = {'image': torch.zeros(2, 3, 320, 480), 'shape': [(640, 960), (400, 600)],
+                 'valid_shape': [(320, 480), (200, 300)]}
+        representer = SegDetectorRepresenter()
+        boxes_batch, scores_batch = representer.represent(batch, torch.stack([pred, pred]))
+        for (height, width), (valid_height, valid_width), boxes, scores in zip(
+                batch['shape'], batch['valid_shape'], boxes_batch, scores_batch):
+            image_pred = pred[:, :valid_height, :valid_width]
+            target_boxes, target_scores = representer.boxes_from_bitmap(
+                image_pred, image_pred > representer.thresh, width, height)
+            assert np.array_equal(boxes, target_boxes)
+            assert np.array_equal(scores, target_scores)
+
+    def checkLabelScores(self):
+        pred = random_pred(seed=2)
+        representer = SegDetectorRepresenter(cmd={'score_mode': 'label', 'box_thresh': 0})
+        prob = pred.numpy()[0]
+        bitmap = (prob > representer.thresh).astype(np.uint8)
+        labels, label_scores = representer.component_scores(prob, bitmap)
+        num_labels, target_labels = cv2.connectedComponents(bitmap, connectivity=8)
+        assert np.array_equal(labels, target_labels)
+        for label in range(1, num_labels):
+            assert abs(label_scores[label] - prob[target_labels == label].mean()) < 1e-5
+        # every box gets the mean probability of the component it was found on
+        _, scores = representer.boxes_from_bitmap(pred, pred > representer.thresh, 960, 640)
+        assert len(scores) > 0
+        for score in scores[scores > 0]:
+            assert np.abs(label_scores[1:] - score).min() < 1e-5
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(representerTestCase("checkFastUnclip"))
+    suite.addTest(representerTestCase("checkRepresentMap"))
+    suite.addTest(representerTestCase("checkLabelScores"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -68,6 +68,8 @@ class Trainer:
             self.logger.info('Training epoch ' + str(epoch))
             self.logger.epoch(epoch)
             self.total = len(train_data_loader)
+            if hasattr(train_data_loader.dataset, 'set_epoch'):
+                train_data_loader.dataset.set_epoch(epoch)
 
             for batch in train_data_loader:
                 self.update_learning_rate(optimizer, epoch, self.steps)
@@ -0,0 +1,126 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+img_exts = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+_detector = None
+_classifier = None
+
+
+def list_images(inputs):
+    '''inputs: image directories, image files or .txt files listing one image path per line.'''
+    list_img_path = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, file_names in os.walk(path):
+                list_img_path.extend(os.path.join(root, fn) for fn in sorted(file_names)
+                                     if fn.lower().endswith(img_exts))
+        elif path.lower().endswith('.txt'):
+            with open(path, encoding='utf-8') as f:
+                list_img_path.extend(line.strip() for line in f if line.strip())
+        else:
+            list_img_path.append(path)
+    return list_img_path
+
+
+def load_done(output_path):
+    '''Files already processed successfully in a previous run of the same output.'''
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:  # last line of an interrupted run
+                continue
+            if 'error' not in record:
+                done.add(record['file'])
+    return done
+
+
+def init_worker(args, num_threads):
+    '''Load the models of a worker process, whose torch, cv2 and preprocessing threads share num_threads cores.'''
+    global _detector, _classifier
+    import cv2
+    import torch
+    torch.set_num_threads(num_threads)
+    cv2.setNumThreads(num_threads)
+    from predict_pytorch import init_models
+    args = dict(args, classifier_workers=num_threads, represent_workers=num_threads)
+    _detector, _classifier = init_models(args, gpu=None)
+
+
+def process_image(img_path):
+    from predict_pytorch import decode_image, get_boxes_data
+    begin = time.time()
+    try:
+        img = decode_image(img_path)
+        if img is None:
+            raise ValueError('Can not read image')
+        boxes = _detector.inference(img)
+        boxes_data, boxes_info, max_wh_ratio = get_boxes_data(img, boxes)
+        values = _classifier.inference(boxes_data, max_wh_ratio) if len(boxes_data) > 0 else []
+        for box, value in zip(boxes_info, values):
+            box.asign_value(value)
+        record = {'file': img_path,
+                  'boxes': [{key: value.item() if hasattr(value, 'item') else value
+                             for key, value in box.export_to_json().items()} for box in boxes_info]}
+    except Exception as e:
+        record = {'file': img_path, 'error': repr(e)}
+    record['time'] = round(time.time() - begin, 4)
+    return record
+
+
+def run(list_img_path, output_path, args, workers=1, chunksize=4):
+    done = load_done(output_path)
+    todo = [img_path for img_path in list_img_path if img_path not in done]
+    print('Total', len(list_img_path), 'images,', len(done), 'already done,', len(todo), 'to process')
+    if len(todo) == 0:
+        return
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context('spawn')
+    begin = time.time()
+    num_errors = 0
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            ctx.Pool(workers, initializer=init_worker, initargs=(args, num_threads)) as pool:
+        for idx, record in enumerate(pool.imap_unordered(process_image, todo, chunksize=chunksize)):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            out.flush()
+            if 'error' in record:
+                num_errors += 1
+                print('Error', record['file'], record['error'])
+            if (idx + 1) % 100 == 0:
+                print('Processed', idx + 1, '/', len(todo), 'images,',
+                      round((idx + 1) / (time.time() - begin), 2), 'images/s')
+    print('Done', len(todo), 'images in', round(time.time() - begin, 2), 'seconds,', num_errors, 'errors')
+
+
+def main():
+    from predict_pytorch import ckpt_path, img_short_side, detector_box_thres, polygon
+    parser = argparse.ArgumentParser(description='OCR a directory of images with several processes')
+    parser.add_argument('inputs', nargs='+', help='image directories, image files or .txt lists of images')
+    parser.add_argument('--output', type=str, default='outputs/results.jsonl',
+                        help='jsonl result file, images already in it are skipped')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help='number of processes, each one loads its own models')
+    parser.add_argument('--chunksize', type=int, default=4)
+    parser.add_argument('--resume', type=str, help='Resume from checkpoint', default=ckpt_path)
+    parser.add_argument('--image_short_side', type=int, default=img_short_side)
+    parser.add_argument('--box_thresh', type=float, default=detector_box_thres)
+    parser.add_argument('--polygon', help='output polygons if true', default=polygon)
+    parser.add_argument('--result_dir', type=str, default='outputs', help='path to save results')
+    args = vars(parser.parse_args())
+
+    output_dir = os.path.dirname(args['output'])
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    list_img_path = list_images(args['inputs'])
+    run(list_img_path, args['output'], args, workers=args['workers'], chunksize=args['chunksize'])
+
+
+if __name__ == '__main__':
+    main()
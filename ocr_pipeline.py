@@ -0,0 +1,209 @@
+import argparse
+import queue
+import threading
+import time
+
+from predict_pytorch import init_models, decode_image, get_boxes_data, gpu, ckpt_path, img_short_side, \
+    detector_box_thres, polygon
+from stage_timer import timers
+
+stage_workers = {'decode': 2, 'detect': 1, 'crop': 2, 'recognize': 1, 'postprocess': 1}
+queue_size = 4
+poll_interval = 0.1  # seconds between checks of the cancel event by blocked threads
+
+_STOP = object()
+
+
+class StageError(object):
+    def __init__(self, stage, exception):
+        self.stage = stage
+        self.exception = exception
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class PipelineRunner:
+    '''
+    Streaming runner: every stage runs in its own worker threads and stages are connected by bounded queues,
+    so a page can be detected while the previous one is recognized. The number of items in flight is bounded
+    (backpressure on the input), results are yielded in input order. An exception raised by a stage is
+    re-raised when the failed item is reached, an exception raised by the input iterator after the items
+    read before it. When the consumer stops (an exception, break or close()), the threads are cancelled:
+    they exit after their current item and the queues are drained.
+    '''
+    def __init__(self, stages, queue_size=queue_size):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        max_in_flight = self.queue_size * (len(self.stages) + 1) + sum(stage.workers for stage in self.stages)
+        in_flight = threading.Semaphore(max_in_flight)
+        cancel = threading.Event()
+
+        def put(out_queue, task):
+            while not cancel.is_set():
+                try:
+                    out_queue.put(task, timeout=poll_interval)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(in_queue):
+            while not cancel.is_set():
+                try:
+                    return in_queue.get(timeout=poll_interval)
+                except queue.Empty:
+                    pass
+            return _STOP
+
+        def feed():
+            num_items = 0
+            try:
+                for item in items:
+                    while not in_flight.acquire(timeout=poll_interval):
+                        if cancel.is_set():
+                            return
+                    if not put(queues[0], (num_items, item)):
+                        return
+                    num_items += 1
+            except Exception as e:  # passed down the stages like a failed item
+                if not put(queues[0], (num_items, StageError('input', e))):
+                    return
+            for _ in range(self.stages[0].workers):
+                put(queues[0], _STOP)
+
+        def work(stage_idx, stopped, lock):
+            stage = self.stages[stage_idx]
+            in_queue, out_queue = queues[stage_idx], queues[stage_idx + 1]
+            while True:
+                task = get(in_queue)
+                if task is _STOP:
+                    break
+                idx, item = task
+                if not isinstance(item, StageError):
+                    try:
+                        with timers.timer('pipeline_' + stage.name):
+                            item = stage.fn(item)
+                    except Exception as e:
+                        item = StageError(stage.name, e)
+                if not put(out_queue, (idx, item)):
+                    return
+            with lock:
+                stopped[0] += 1
+                last = stopped[0] == stage.workers
+            if last:
+                next_workers = self.stages[stage_idx + 1].workers if stage_idx + 1 < len(self.stages) else 1
+                for _ in range(next_workers):
+                    put(out_queue, _STOP)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for stage_idx, stage in enumerate(self.stages):
+            stopped, lock = [0], threading.Lock()
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(target=work, args=(stage_idx, stopped, lock), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        pending = dict()
+        next_idx = 0
+        try:
+            while True:
+                try:
+                    task = queues[-1].get(timeout=poll_interval)
+                except queue.Empty:
+                    if any(thread.is_alive() for thread in threads) or not queues[-1].empty():
+                        continue
+                    raise RuntimeError('Pipeline threads stopped before the last item')
+                if task is not _STOP:
+                    pending[task[0]] = task[1]
+                while next_idx in pending:
+                    result = pending.pop(next_idx)
+                    next_idx += 1
+                    in_flight.release()
+                    if isinstance(result, StageError):
+                        raise RuntimeError('Stage %s failed on item %d' % (result.stage, next_idx - 1)) \
+                            from result.exception
+                    yield result
+                if task is _STOP:
+                    break
+        finally:
+            cancel.set()
+            for task_queue in queues:  # drop the items left in flight
+                while True:
+                    try:
+                        task_queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+
+def build_ocr_pipeline(detector, classifier, workers=stage_workers, queue_size=queue_size):
+    '''
+    decode -> detect -> crop -> recognize -> postprocess, for the Detector_DB / Classifier_CRNN pair.
+    Each item is an image path, encoded bytes or decoded ndarray, each result is the list of bbox of the page
+    with their recognized value.
+    The recognize stage has a single worker: Classifier_CRNN.inference reuses the classifier's input buffer.
+    '''
+    if workers.get('recognize', 1) != 1:
+        raise ValueError('recognize runs a single worker, Classifier_CRNN.inference is not thread safe')
+
+    def detect(img):
+        return img, detector.inference(img)
+
+    def crop(data):
+        img, boxes = data
+        return get_boxes_data(img, boxes)
+
+    def recognize(data):
+        boxes_data, boxes_info, max_wh_ratio = data
+        values = classifier.inference(boxes_data, max_wh_ratio) if len(boxes_data) > 0 else []
+        return boxes_info, values
+
+    def postprocess(data):
+        boxes_info, values = data
+        for box, value in zip(boxes_info, values):
+            box.asign_value(value)
+        return boxes_info
+
+    stages = [Stage('decode', decode_image, workers.get('decode', 1)),
+              Stage('detect', detect, workers.get('detect', 1)),
+              Stage('crop', crop, workers.get('crop', 1)),
+              Stage('recognize', recognize, workers.get('recognize', 1)),
+              Stage('postprocess', postprocess, workers.get('postprocess', 1))]
+    return PipelineRunner(stages, queue_size=queue_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming OCR pipeline')
+    parser.add_argument('images', nargs='+', help='images to process')
+    parser.add_argument('--resume', type=str, help='Resume from checkpoint', default=ckpt_path)
+    parser.add_argument('--image_short_side', type=int, default=img_short_side)
+    parser.add_argument('--box_thresh', type=float, default=detector_box_thres)
+    parser.add_argument('--polygon', help='output polygons if true', default=polygon)
+    parser.add_argument('--result_dir', type=str, default='outputs', help='path to save results')
+    parser.add_argument('--queue_size', type=int, default=queue_size)
+    for name, workers in stage_workers.items():
+        parser.add_argument('--%s_workers' % name, type=int, default=workers)
+    args = vars(parser.parse_args())
+
+    detector, classifier = init_models(args, gpu=gpu)
+    workers = {name: args['%s_workers' % name] for name in stage_workers}
+    pipeline = build_ocr_pipeline(detector, classifier, workers=workers, queue_size=args['queue_size'])
+    begin = time.time()
+    for img_path, boxes_info in zip(args['images'], pipeline.run(args['images'])):
+        print('\nResult of:', img_path)
+        for box in boxes_info:
+            print(box.xmin, box.ymin, box.xmax, box.ymax, box.value)
+    total_time = time.time() - begin
+    print('\nTotal time:', total_time, 'seconds,', round(len(args['images']) / total_time, 2), 'images/s')
+    timers.report()
+
+
+if __name__ == '__main__':
+    main()
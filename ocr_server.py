@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from predict_pytorch import init_models, decode_image, get_boxes_data, ckpt_path, img_short_side, \
+    detector_box_thres, polygon
+from stage_timer import timers, profile
+
+host = '127.0.0.1'
+port = 8080
+max_batch_size = 64  # max number of crops in a CRNN batch
+max_wait_ms = 10  # max time a crop waits for crops of other requests
+detector_workers = 1  # max number of pages detected at the same time
+profile_dir = 'outputs'
+
+
+class RecognitionBatcher:
+    '''
+    Collects the crops of concurrent requests into shared CRNN batches: a batch is run once it holds
+    max_batch_size crops or its first crop has waited max_wait_ms. A request that does not fit waits for
+    the next batch, a request of more than max_batch_size crops is recognized alone, max_batch_size at a time.
+    '''
+    def __init__(self, classifier, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.queue = queue.Queue()
+        self.pending = None  # the request that did not fit in the last batch
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, crops):
+        future = Future()
+        self.queue.put((crops, future))
+        return future
+
+    def collect(self):
+        if self.pending is not None:
+            requests, self.pending = [self.pending], None
+        else:
+            requests = [self.queue.get()]
+        num_crops = len(requests[0][0])
+        deadline = time.time() + self.max_wait_ms / 1000.
+        while num_crops < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if num_crops + len(request[0]) > self.max_batch_size:
+                self.pending = request
+                break
+            requests.append(request)
+            num_crops += len(request[0])
+        return requests
+
+    def recognize(self, crops):
+        max_wh_ratio = max(1.0 * crop.shape[1] / crop.shape[0] for crop in crops)
+        with timers.timer('recognize_batch'):
+            return self.classifier.inference(crops, max_wh_ratio, bucketing=True, batch_sz=self.max_batch_size)
+
+    def loop(self):
+        while True:
+            requests = self.collect()
+            crops = [crop for request_crops, _ in requests for crop in request_crops]
+            try:
+                values = self.recognize(crops)
+            except Exception as e:
+                if len(requests) == 1:
+                    requests[0][1].set_exception(e)
+                    continue
+                # recognize every request alone, only the one with the bad crop fails
+                for request_crops, future in requests:
+                    try:
+                        future.set_result(self.recognize(request_crops))
+                    except Exception as request_error:
+                        future.set_exception(request_error)
+                continue
+            index = 0
+            for request_crops, future in requests:
+                future.set_result(values[index:index + len(request_crops)])
+                index += len(request_crops)
+
+
+class OCRService:
+    def __init__(self, detector, classifier, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                 detector_workers=detector_workers):
+        self.detector = detector
+        self.batcher = RecognitionBatcher(classifier, max_batch_size, max_wait_ms)
+        self.detector_slots = threading.Semaphore(detector_workers)
+
+    def predict(self, image, profile_kind=None):
+        '''
+        image: encoded image bytes. Returns the recognized boxes and the latency of every stage.
+        profile_kind: None, 'cprofile' or 'torch' to profile this request, written to profile_dir.
+        '''
+        if profile_kind is not None:
+            with profile(profile_kind, os.path.join(profile_dir, 'request_%d' % int(time.time() * 1000))):
+                return self.predict(image)
+        timing = dict()
+        begin = time.time()
+        img = decode_image(image)
+        if img is None:
+            raise ValueError('Can not decode image')
+        timing['decode'] = time.time() - begin
+
+        begin = time.time()
+        with self.detector_slots:
+            boxes = self.detector.inference(img)
+        timing['detect'] = time.time() - begin
+
+        begin = time.time()
+        boxes_data, boxes_info, _ = get_boxes_data(img, boxes)
+        timing['crop'] = time.time() - begin
+
+        begin = time.time()
+        values = self.batcher.submit(boxes_data).result() if len(boxes_data) > 0 else []
+        timing['recognize'] = time.time() - begin
+
+        for box, value in zip(boxes_info, values):
+            box.asign_value(value)
+        timing['total'] = sum(timing.values())
+        for stage, seconds in timing.items():
+            timers.add('request_' + stage, seconds)
+        return {'boxes': [box.export_to_json() for box in boxes_info],
+                'timing_ms': {stage: round(seconds * 1000., 3) for stage, seconds in timing.items()}}
+
+
+def to_json(value):
+    if isinstance(value, np.generic):  # box coordinates are numpy scalars
+        return value.item()
+    raise TypeError('%s is not JSON serializable' % type(value).__name__)
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    '''
+    POST /ocr    body: encoded image, returns the recognized boxes as json
+        ?profile=cprofile|torch profiles the request
+    GET /stats   latency percentiles of every stage, as json
+    GET /metrics same, in prometheus text format
+    GET /health
+    '''
+    def send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False, default=to_json).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/stats':
+            self.send_json(200, timers.summary())
+        elif path == '/metrics':
+            body = timers.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/ocr':
+            self.send_json(404, {'error': 'not found'})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        profile_kind = parse_qs(url.query).get('profile', [None])[0]
+        try:
+            result = self.server.service.predict(body, profile_kind=profile_kind)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+            return
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(service, host=host, port=port):
+    server = ThreadingHTTPServer((host, port), OCRRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    print('Serving OCR on http://%s:%d' % (host, port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OCR http service')
+    parser.add_argument('--host', type=str, default=host)
+    parser.add_argument('--port', type=int, default=port)
+    parser.add_argument('--max_batch_size', type=int, default=max_batch_size,
+                        help='max number of crops in a CRNN batch')
+    parser.add_argument('--max_wait_ms', type=float, default=max_wait_ms,
+                        help='max time a crop waits for crops of other requests')
+    parser.add_argument('--detector_workers', type=int, default=detector_workers)
+    parser.add_argument('--resume', type=str, help='Resume from checkpoint', default=ckpt_path)
+    parser.add_argument('--image_short_side', type=int, default=img_short_side)
+    parser.add_argument('--box_thresh', type=float, default=detector_box_thres)
+    parser.add_argument('--polygon', help='output polygons if true', default=polygon)
+    parser.add_argument('--result_dir', type=str, default='outputs', help='path to save results')
+    args = vars(parser.parse_args())
+
+    detector, classifier = init_models(args, gpu=None)
+    service = OCRService(detector, classifier, max_batch_size=args['max_batch_size'],
+                         max_wait_ms=args['max_wait_ms'], detector_workers=args['detector_workers'])
+    serve(service, host=args['host'], port=args['port'])
+
+
+if __name__ == '__main__':
+    main()
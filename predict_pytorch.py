@@ -3,6 +3,8 @@ import torch, cv2, math
 import os, time
 from detector_DB.concern.config import Configurable, Config
 from BoundingBox import bbox
+from stage_timer import timers, profile
+from onnx_backend import OnnxModel
 import argparse
 
 # classifier
@@ -13,7 +15,7 @@ import classifier_CRNN.models.utils as utils
 from torchvision import transforms
 from pre_processing.augment_functions import cnd_aug_randomResizePadding, cnd_aug_resizePadding
 from torchvision.transforms import RandomApply, ColorJitter, RandomAffine, ToTensor, Normalize
-from classifier_CRNN.utils.loader import NumpyListLoader, alignCollate
+from classifier_CRNN.utils.loader import NumpyListLoader, alignCollate, numpyAlignCollate, ratio_buckets, PreprocessPool
 from matplotlib import pyplot as plt
 import matplotlib.patches as patches
 from structure.model import SegDetectorModel
@@ -33,10 +35,22 @@ ckpt_path = 'detector_DB_train/outputs/' + detector_model
 detector_model = 'model_epoch_571_minibatch_12000'
 ckpt_path = 'detector_DB_train/outputs/train_2020-04-28_22-54/model' + detector_model
 
+detector_backbone = 'resnet18'  # or 'deformable_resnet18', the deformable convs also run on cpu
 detector_box_thres = 0.315
+detector_score_mode = 'box'  # 'box' or 'label' (connected components, faster on dense pages)
+detector_represent_workers = 0  # threads post-processing the pages of a batch, 0 for one per core
 polygon = False
 visualize = False
 img_short_side = 736  # 736
+detector_batch_sz = 4
+detector_tile_size = 1024  # tiles of inference_tiled, multiple of 32
+detector_tile_overlap = 128
+# adaptive resolution: a coarse pass estimates the text size, the page is re-run only if text is too small
+detector_coarse_short_side = 512
+detector_max_short_side = 1600
+detector_target_box_height = 24  # median short side of the boxes, in resized pixels, at which the model works best
+detector_box_height_tolerance = 0.25
+save_result = False
 
 # classifier
 classifier_ckpt_path = 'AICR_pretrained_59_Test_43.16_cer_0.227.pth'
@@ -48,6 +62,10 @@ if classifier_height == 64:
     classifier_ckpt_path = 'classifier_CRNN/ckpt/AICR_SDV_30Mar_300_loss_1.25_cer_0.0076.pth'
     alphabet_path = 'config/char_246'
 classifier_batch_sz = 16
+classifier_bucketing = True
+classifier_workers = 4
+classifier_min_parallel = 8  # fewer crops than this are preprocessed in the calling thread
+classifier_quantize = None  # None or 'dynamic': int8 LSTM / Linear layers, cpu only
 mean = [0.485, 0.456, 0.406]
 std = [0.229, 0.224, 0.225]
 fill_color = (255, 255, 255)
@@ -67,43 +85,63 @@ def main():
                         help='The threshold to replace it in the representers')
     parser.add_argument('--thresh', type=float,
                         help='The threshold to replace it in the representers')
+    parser.add_argument('--backbone', choices=['resnet18', 'deformable_resnet18'], default=detector_backbone,
+                        help='backbone of the checkpoint, ignored for exported models')
     parser.add_argument('--box_thresh', type=float, default=detector_box_thres,
                         help='The threshold to replace it in the representers')
+    parser.add_argument('--score_mode', choices=['box', 'label'], default=detector_score_mode,
+                        help='box scoring of the representer, label is faster on dense pages')
+    parser.add_argument('--represent_workers', type=int, default=detector_represent_workers,
+                        help='threads post-processing the pages of a batch, 0 for one per core')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='choose the detection resolution from the text size of a coarse pass')
+    parser.add_argument('--tiled', action='store_true',
+                        help='detect large pages in native resolution tiles instead of resizing them')
     parser.add_argument('--resize', action='store_true', help='resize')
     parser.add_argument('--visualize', default=visualize, help='visualize maps in tensorboard')
     parser.add_argument('--polygon', help='output polygons if true', default=polygon)
+    parser.add_argument('--save_result', action='store_true', default=save_result,
+                        help='write res_*.txt detection results to result_dir')
     parser.add_argument('--eager', '--eager_show', action='store_true', dest='eager_show',
                         help='Show iamges eagerly')
+    parser.add_argument('--profile', choices=['cprofile', 'torch'],
+                        help='profile the prediction, written to result_dir')
+    parser.add_argument('--timing_json', type=str, help='write stage timings to this json file')
+    parser.add_argument('--timing_prom', type=str, help='write stage timings to this prometheus text file')
 
     args = parser.parse_args()
     args = vars(args)
     args = {k: v for k, v in args.items() if v is not None}
 
     # initialize
-    begin_init = time.time()
-    detector, classifier = init_models(args, gpu=gpu)
-    test_img = cv2.imread(img_path)
-    end_init = time.time()
-    print('Init models time:', end_init - begin_init, 'seconds')
-
-    boxes_list = detector.inference(img_path, visualize)
-    end_detector = time.time()
-    print('Detector time:', end_detector - end_init, 'seconds')
-
-    boxes_data, boxes_info, max_wh_ratio = get_boxes_data(test_img, boxes_list)
-    end_get_boxes_data = time.time()
-    print('Get boxes time:', end_get_boxes_data - end_detector, 'seconds')
-
-    values = classifier.inference(boxes_data, max_wh_ratio)
-    end_classifier = time.time()
-    print('Classifier time:', end_classifier - end_get_boxes_data, 'seconds')
-    print('\nTotal predict time:', end_classifier - end_init, 'seconds')
+    with timers.timer('init_models'):
+        detector, classifier = init_models(args, gpu=gpu)
+
+    if 'profile' in args and not os.path.isdir(args['result_dir']):
+        os.mkdir(args['result_dir'])
+    with profile(args.get('profile'), os.path.join(args['result_dir'], 'profile')), timers.timer('predict'):
+        test_img = decode_image(img_path)
+        with timers.timer('detector'):
+            if 'tiled' in args and args['tiled']:
+                boxes_list = detector.inference_tiled(test_img, filename=img_path)
+            elif 'adaptive' in args and args['adaptive']:
+                boxes_list, short_side = detector.inference(test_img, visualize, filename=img_path, adaptive=True)
+                print('Detected at short side', short_side)
+            else:
+                boxes_list = detector.inference(test_img, visualize, filename=img_path)
+        boxes_data, boxes_info, max_wh_ratio = get_boxes_data(test_img, boxes_list)
+        with timers.timer('classifier'):
+            values = classifier.inference(boxes_data, max_wh_ratio)
 
     for idx, box in enumerate(boxes_info):
         box.asign_value(values[idx])
-    visualize_results(test_img, boxes_info, draw_text)
-    end_visualize = time.time()
-    print('Visualize time:', end_visualize - end_classifier, 'seconds')
+    with timers.timer('visualize'):
+        visualize_results(test_img, boxes_info, draw_text)
+    timers.report()
+    if 'timing_json' in args:
+        timers.to_json(args['timing_json'])
+    if 'timing_prom' in args:
+        timers.to_prometheus(args['timing_prom'])
     print('Done')
 
 
@@ -135,10 +173,23 @@ def init_models(args, gpu='0'):
         print('Use CPU')
     detector = Detector_DB(gpu=gpu, cmd=args)
     classifier = Classifier_CRNN(ckpt_path=classifier_ckpt_path, batch_sz=classifier_batch_sz,
-                                 imgW=classifier_width, imgH=classifier_height, gpu=gpu, alphabet_path=alphabet_path)
+                                 imgW=classifier_width, imgH=classifier_height, gpu=gpu, alphabet_path=alphabet_path,
+                                 workers=args.get('classifier_workers', classifier_workers))
     return detector, classifier
 
 
+def decode_image(image):
+    '''
+    image: image path, encoded image bytes or an already decoded BGR ndarray.
+    '''
+    if isinstance(image, np.ndarray):
+        return image
+    with timers.timer('decode'):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        return cv2.imread(image, cv2.IMREAD_COLOR)
+
+
 class Detector_DB:
     def __init__(self, gpu='0', cmd=dict()):
         self.RGB_MEAN = np.array([122.67891434, 116.66876762, 104.00698793])
@@ -148,7 +199,9 @@ class Detector_DB:
         self.init_model(self.args['resume'])
         self.model.eval()
 
-        self.segRepresent = SegDetectorRepresenter()
+        self.segRepresent = SegDetectorRepresenter(
+            cmd={'score_mode': self.args.get('score_mode', detector_score_mode),
+                 'workers': self.args.get('represent_workers', detector_represent_workers)})
         self.segVisualizer = SegDetectorVisualizer()
 
     def init_torch_tensor(self):
@@ -160,7 +213,21 @@ class Detector_DB:
             torch.set_default_tensor_type('torch.FloatTensor')
 
     def init_model(self, path):
-        self.model = SegDetectorModel(self.device, distributed=False, local_rank=0)
+        '''
+        path: training checkpoint, or a graph exported by detector_DB/export.py:
+            *.torchscript (frozen TorchScript) or *.onnx (run on onnxruntime, cpu).
+        '''
+        self.exported = path.endswith('.torchscript') or path.endswith('.onnx')
+        if path.endswith('.torchscript'):
+            self.model = torch.jit.load(path, map_location=self.device)
+            print("Loaded " + path)
+            return
+        if path.endswith('.onnx'):
+            self.model = OnnxModel(path)
+            print("Loaded " + path)
+            return
+        self.model = SegDetectorModel(self.device, distributed=False, local_rank=0,
+                                      backbone=self.args.get('backbone', detector_backbone))
         if not os.path.exists(path):
             print("Checkpoint not found: " + path)
             return
@@ -169,26 +236,55 @@ class Detector_DB:
         self.model.load_state_dict(states, strict=False)
         print("Resumed from " + path)
 
-    def resize_image(self, img):
+    def forward(self, batch):
+        if self.exported:
+            return self.model(batch['image'].to(self.device).float())
+        return self.model.forward(batch, training=False)
+
+    @timers.timed('detect_resize')
+    def resize_image(self, img, short_side=None):
+        short_side = short_side or self.args['image_short_side']
         height, width, _ = img.shape
         if height < width:
-            new_height = self.args['image_short_side']
+            new_height = short_side
             new_width = int(math.ceil(new_height / height * width / 32) * 32)
         else:
-            new_width = self.args['image_short_side']
+            new_width = short_side
             new_height = int(math.ceil(new_width / width * height / 32) * 32)
         resized_img = cv2.resize(img, (new_width, new_height))
         return resized_img
 
-    def load_image(self, image_path):
-        img = cv2.imread(image_path, cv2.IMREAD_COLOR).astype('float32')
+    def normalize_image(self, img, short_side=None):
+        img = img.astype('float32')
         original_shape = img.shape[:2]
-        img = self.resize_image(img)
+        img = self.resize_image(img, short_side)
         img -= self.RGB_MEAN
         img /= 255.
+        return img, original_shape
+
+    def load_image(self, image, short_side=None):
+        img = decode_image(image)
+        img, original_shape = self.normalize_image(img, short_side)
         img = torch.from_numpy(img).permute(2, 0, 1).float().unsqueeze(0)
         return img, original_shape
 
+    def load_batch(self, list_img, shape=None):
+        '''
+        list_img: list of normalized (H, W, 3) images of the same orientation.
+        Smaller images are padded at the bottom/right (edge replicated) to the largest shape (at least shape),
+        their own shapes are kept in 'valid_shape' so the representer can crop the padding off.
+        '''
+        max_height = max([img.shape[0] for img in list_img] + ([shape[0]] if shape else []))
+        max_width = max([img.shape[1] for img in list_img] + ([shape[1]] if shape else []))
+        data = np.empty((len(list_img), max_height, max_width, 3), dtype=np.float32)
+        valid_shape = []
+        for idx, img in enumerate(list_img):
+            height, width = img.shape[:2]
+            data[idx] = np.pad(img, ((0, max_height - height), (0, max_width - width), (0, 0)), mode='edge')
+            valid_shape.append((height, width))
+        data = torch.from_numpy(data).permute(0, 3, 1, 2).contiguous()
+        return data, valid_shape
+
     def format_output(self, batch, output):
         batch_boxes, batch_scores = output
         for index in range(batch['image'].size(0)):
@@ -215,32 +311,208 @@ class Detector_DB:
                         result = ",".join([str(int(x)) for x in box])
                         res.write(result + ',' + str(score) + "\n")
 
-    def inference(self, image_path, visualize=False):
+    def save_output(self, batch, output):
+        if not self.args.get('save_result', False):
+            return
+        if not os.path.isdir(self.args['result_dir']):
+            os.mkdir(self.args['result_dir'])
+        self.format_output(batch, output)
+
+    def inference(self, image, visualize=False, filename=None, return_scores=False, short_side=None, adaptive=False):
+        '''
+        image: image path, encoded image bytes or decoded BGR ndarray.
+        filename: name used for the optional res_*.txt / visualized outputs, defaults to the image path.
+        short_side: resize the image to this short side instead of image_short_side.
+        adaptive: choose the short side from a coarse pass instead, see inference_adaptive.
+        Returns the boxes (and their scores if return_scores), followed by the short side used if adaptive.
+        Nothing is written to disk unless 'save_result' is set.
+        '''
+        if filename is None:
+            filename = image if isinstance(image, str) else 'image'
+        img = decode_image(image)
+        if adaptive:
+            boxes, scores, short_side = self.inference_adaptive(img, filename=filename, return_scores=True)
+        else:
+            boxes, scores = self.detect(img, filename, short_side)
+
+        if visualize:
+            vis_image = self.segVisualizer.demo_visualize(img, ([boxes], [scores]))
+            if not os.path.isdir(self.args['result_dir']):
+                os.mkdir(self.args['result_dir'])
+            cv2.imwrite(os.path.join(self.args['result_dir'],
+                                     filename.split('/')[-1].split('.')[0] + '_ ' + detector_model + '_ ' + str
+                                     (detector_box_thres) + '.jpg'), vis_image)
+        if adaptive:
+            return (boxes, scores, short_side) if return_scores else (boxes, short_side)
+        if return_scores:
+            return boxes, scores
+        return boxes
+
+    def detect(self, img, filename, short_side=None, min_size=None):
+        '''
+        One pass of the model on the decoded image img resized to short_side, returns its boxes and scores.
+        min_size: smallest box side kept by the representer, in pixels of the probability map.
+        '''
         batch = dict()
-        batch['filename'] = [image_path]
-        img, original_shape = self.load_image(image_path)
+        batch['filename'] = [filename]
+        batch['image'], original_shape = self.load_image(img, short_side)
         batch['shape'] = [original_shape]
         with torch.no_grad():
-            batch['image'] = img
-            pred = self.model.forward(batch, training=False)
-            output = self.segRepresent.represent(batch, _pred=pred, is_output_polygon=self.args['polygon'])
-            if not os.path.isdir(self.args['result_dir']):
-                os.mkdir(self.args['result_dir'])
-            self.format_output(batch, output)
-            boxes, _ = output
-            boxes = boxes[0]
-
-            if visualize:
-                vis_image = self.segVisualizer.demo_visualize(image_path, output)
-                cv2.imwrite(os.path.join(self.args['result_dir'],
-                                         image_path.split('/')[-1].split('.')[0] + '_ ' + detector_model + '_ ' + str
-                                         (detector_box_thres) + '.jpg'), vis_image)
-            return boxes
+            with timers.timer('detect_forward'):
+                pred = self.forward(batch)
+            with timers.timer('detect_represent'):
+                output = self.segRepresent.represent(batch, _pred=pred, is_output_polygon=self.args['polygon'],
+                                                     min_size=min_size)
+        self.save_output(batch, output)
+        boxes, scores = output
+        return boxes[0], scores[0]
+
+    def box_height(self, boxes, scores, scale=1.0):
+        '''Median short side of the confident boxes (score >= box_thresh), times scale. None without boxes.'''
+        heights = [min(cv2.minAreaRect(np.array(box, dtype=np.float32).reshape(-1, 2))[1])
+                   for box, score in zip(boxes, scores) if score >= self.args['box_thresh']]
+        heights = [height for height in heights if height > 0]  # boxes dropped by the representer are zeros
+        if len(heights) == 0:
+            return None
+        return float(np.median(heights)) * scale
+
+    def inference_adaptive(self, image, coarse_short_side=detector_coarse_short_side,
+                           target_box_height=detector_target_box_height, max_short_side=detector_max_short_side,
+                           tolerance=detector_box_height_tolerance, filename=None, return_scores=False):
+        '''
+        Coarse to fine resolution: the page is first detected at coarse_short_side. If its text is large
+        enough there (median box height >= (1 - tolerance) * target_box_height) these boxes are returned,
+        otherwise the page is detected again at the short side bringing the median box height to
+        target_box_height (at most max_short_side). Pages without confident boxes fall back to image_short_side.
+        The representer's min_size is scaled to the coarse pass, so that it drops the same text size on the page
+        as at image_short_side instead of the small text that calls for the second pass.
+        Returns boxes (and scores if return_scores) and the short side used.
+        '''
+        img = decode_image(image)
+        if filename is None:
+            filename = image if isinstance(image, str) else 'image'
+        min_size = self.segRepresent.min_size * coarse_short_side / self.args['image_short_side']
+        boxes, scores = self.detect(img, filename, coarse_short_side, min_size=min_size)
+        scale = 1.0 * coarse_short_side / min(img.shape[:2])
+        box_height = self.box_height(boxes, scores, scale)
+        if box_height is None:
+            short_side = self.args['image_short_side']
+        elif box_height >= (1 - tolerance) * target_box_height:
+            short_side = coarse_short_side
+        else:
+            short_side = coarse_short_side * target_box_height / box_height
+            short_side = int(min(max_short_side, math.ceil(short_side / 32.) * 32))
+        if short_side > coarse_short_side:
+            boxes, scores = self.detect(img, filename, short_side)
+        if return_scores:
+            return boxes, scores, short_side
+        return boxes, short_side
+
+    def inference_batch(self, list_image, batch_sz=detector_batch_sz, list_filename=None):
+        '''
+        Detect text boxes for several images (paths, encoded bytes or decoded ndarrays), running the model
+        once per batch instead of once per image.
+        Images are grouped by orientation and sorted by resized shape, so images of a batch share (or nearly
+        share) their shape after resize_image. Returns the list of boxes of every image, in input order.
+        '''
+        if list_filename is None:
+            list_filename = [image if isinstance(image, str) else 'image_%d' % idx
+                             for idx, image in enumerate(list_image)]
+        list_data = []
+        for image in list_image:
+            list_data.append(self.normalize_image(decode_image(image)))
+
+        groups = dict()
+        for idx, (img, _) in enumerate(list_data):
+            landscape = img.shape[0] < img.shape[1]
+            groups.setdefault(landscape, []).append(idx)
+
+        boxes_list = [None] * len(list_image)
+        with torch.no_grad():
+            for indices in groups.values():
+                indices = sorted(indices, key=lambda i: list_data[i][0].shape[:2])
+                for begin in range(0, len(indices), batch_sz):
+                    batch_indices = indices[begin:begin + batch_sz]
+                    batch = dict()
+                    batch['filename'] = [list_filename[i] for i in batch_indices]
+                    batch['shape'] = [list_data[i][1] for i in batch_indices]
+                    batch['image'], batch['valid_shape'] = self.load_batch([list_data[i][0] for i in batch_indices])
+                    with timers.timer('detect_forward'):
+                        pred = self.forward(batch)
+                    with timers.timer('detect_represent'):
+                        output = self.segRepresent.represent(batch, _pred=pred,
+                                                             is_output_polygon=self.args['polygon'])
+                    self.save_output(batch, output)
+                    for i, boxes in zip(batch_indices, output[0]):
+                        boxes_list[i] = boxes
+        return boxes_list
+
+    def tile_starts(self, length, tile_size, overlap):
+        '''Offsets of the tiles of tile_size covering [0, length), neighbours share at least overlap pixels.'''
+        if length <= tile_size:
+            return [0]
+        stride = tile_size - overlap
+        num_tiles = int(math.ceil(1.0 * (length - overlap) / stride))
+        return [min(idx * stride, length - tile_size) for idx in range(num_tiles)]
+
+    def inference_tiled(self, image, tile_size=detector_tile_size, overlap=detector_tile_overlap, scale=1.0,
+                        batch_sz=detector_batch_sz, filename=None, return_scores=False):
+        '''
+        Large page detection: the page (scaled by scale, 1 for native resolution) is cut into overlapping
+        tile_size x tile_size tiles, run batch_sz tiles at a time. Their probability maps are stitched
+        (max over the overlaps) into one page map and represented at once, so text crossing a seam gives
+        a single box. The model memory is bounded by the tile batch whatever the page size.
+        '''
+        if filename is None:
+            filename = image if isinstance(image, str) else 'image'
+        img = decode_image(image)
+        original_shape = img.shape[:2]
+        if scale != 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale,
+                             interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        height, width = img.shape[:2]
+        # pages smaller than a tile run as a single tile padded to a multiple of 32
+        tile_shape = (min(tile_size, int(math.ceil(height / 32.) * 32)), min(tile_size, int(math.ceil(width / 32.) * 32)))
+        tiles = [(top, left) for top in self.tile_starts(height, tile_shape[0], overlap)
+                 for left in self.tile_starts(width, tile_shape[1], overlap)]
+
+        page_pred = np.zeros((height, width), dtype=np.float32)
+        with torch.no_grad():
+            for begin in range(0, len(tiles), batch_sz):
+                list_tile = []
+                for top, left in tiles[begin:begin + batch_sz]:
+                    tile = img[top:top + tile_shape[0], left:left + tile_shape[1]].astype(np.float32)
+                    tile -= self.RGB_MEAN
+                    tile /= 255.
+                    list_tile.append(tile)
+                batch = dict()
+                batch['image'], valid_shape = self.load_batch(list_tile, shape=tile_shape)
+                with timers.timer('detect_forward'):
+                    pred = self.forward(batch).cpu().numpy()
+                for (top, left), (tile_height, tile_width), tile_pred in zip(tiles[begin:begin + batch_sz],
+                                                                              valid_shape, pred):
+                    region = page_pred[top:top + tile_height, left:left + tile_width]
+                    np.maximum(region, tile_pred[0, :tile_height, :tile_width], out=region)
+
+            page_pred = torch.from_numpy(page_pred)[None, None]
+            batch = {'image': page_pred, 'shape': [original_shape], 'filename': [filename]}
+            with timers.timer('detect_represent'):
+                output = self.segRepresent.represent(batch, _pred=page_pred, is_output_polygon=self.args['polygon'])
+            self.save_output(batch, output)
+        boxes, scores = output
+        if return_scores:
+            return boxes[0], scores[0]
+        return boxes[0]
 
 
 class Classifier_CRNN:
-    def __init__(self, ckpt_path='', gpu='0', batch_sz=16, workers=4, num_channel=3, imgW=256, imgH=64,
-                 alphabet_path='config/char_246'):
+    def __init__(self, ckpt_path='', gpu='0', batch_sz=16, workers=classifier_workers, num_channel=3, imgW=256,
+                 imgH=64, alphabet_path='config/char_246', min_parallel=classifier_min_parallel,
+                 quantize=classifier_quantize):
+        '''
+        ckpt_path: state dict of CRNN32 / CRNN64, or a model exported by classifier_CRNN/export.py (*.onnx)
+            or classifier_CRNN/quantize.py (*.torchscript, e.g. static int8).
+        '''
         self.imgW = imgW
         self.imgH = imgH
         self.batch_sz = batch_sz
@@ -249,61 +521,76 @@ class Classifier_CRNN:
         self.image = torch.FloatTensor(batch_sz, 3, imgH, imgH)
         self.text = torch.IntTensor(batch_sz * 5)
         self.length = torch.IntTensor(batch_sz)
-        if classifier_height == 32:
-            self.model = crnn.CRNN32(imgH, num_channel, nclass, 256)
+        if ckpt_path.endswith('.onnx'):  # exported by classifier_CRNN/export.py, run on onnxruntime, cpu
+            self.model = OnnxModel(ckpt_path)
+        elif ckpt_path.endswith('.torchscript'):
+            self.model = torch.jit.load(ckpt_path, map_location='cpu')
         else:
-            self.model = crnn.CRNN64(imgH, num_channel, nclass, 256)
-        if gpu != None and torch.cuda.is_available():
-            self.model = self.model.cuda()
-            self.image = self.image.cuda()
+            if classifier_height == 32:
+                self.model = crnn.CRNN32(imgH, num_channel, nclass, 256)
+            else:
+                self.model = crnn.CRNN64(imgH, num_channel, nclass, 256)
+            if gpu != None and torch.cuda.is_available():
+                self.model = self.model.cuda()
+                self.image = self.image.cuda()
+            self.model.load_state_dict(torch.load(ckpt_path, map_location='cpu'))
+            if quantize == 'dynamic' and not next(self.model.parameters()).is_cuda:
+                self.model = torch.quantization.quantize_dynamic(self.model.eval(), {torch.nn.LSTM, torch.nn.Linear},
+                                                                 dtype=torch.qint8)
         print('Classifier. Resumed from %s' % ckpt_path)
-        self.model.load_state_dict(torch.load(ckpt_path, map_location='cpu'))
         self.converter = strLabelConverter(alphabet, ignore_case=False)
         self.image = Variable(self.image)
         self.text = Variable(self.text)
         self.length = Variable(self.length)
         self.workers = workers
+        self.pool = PreprocessPool(workers, min_parallel)
         self.model.eval()
 
-    def inference(self, img_list, max_wh_ratio):
-        new_W = int(self.imgH * max_wh_ratio)
-        print('New W', new_W)
-        transform_test = transforms.Compose([
-            # cnd_aug_randomResizePadding(imgH, imgW, min_scale, max_scale, fill=fill_color, train=False),
-            cnd_aug_resizePadding(new_W, self.imgH, fill=fill_color, train=False),
-            ToTensor(),
-            Normalize(mean, std)
-        ])
-
-        val_dataset = NumpyListLoader(img_list, transform=transform_test)
-        num_files = len(val_dataset)
+    def inference(self, img_list, max_wh_ratio, bucketing=classifier_bucketing, return_scores=False, batch_sz=None):
+        '''
+        img_list: list of crops as decoded ndarrays or encoded image bytes.
+        bucketing: sort crops by w/h ratio and pad every batch to its own widest crop
+            instead of padding all crops to imgH * max_wh_ratio. Output order is unchanged.
+        batch_sz: crops per CRNN forward, self.batch_sz by default.
+        Returns the list of recognized strings, and their confidences if return_scores.
+        '''
+        img_list = [decode_image(img) for img in img_list]
+        num_files = len(img_list)
+        batch_sz = batch_sz or self.batch_sz
         print('Classifier. Begin classify', num_files, 'boxes')
-        values = []
-        val_loader = torch.utils.data.DataLoader(
-            val_dataset,
-            batch_size=self.batch_sz,
-            num_workers=self.workers,
-            shuffle=False
-        )
-
-        val_iter = iter(val_loader)
-        max_iter = len(val_loader)
-        # print('Number of samples', num_files)
+        if bucketing:
+            wh_ratios = [1.0 * img.shape[1] / img.shape[0] for img in img_list]
+            batches = ratio_buckets(wh_ratios, batch_sz)
+            collate = numpyAlignCollate(self.imgH, max_wh_ratio=max_wh_ratio, fill=fill_color)
+        else:
+            new_W = int(self.imgH * max_wh_ratio)
+            print('New W', new_W)
+            batches = [list(range(begin, min(begin + batch_sz, num_files)))
+                       for begin in range(0, num_files, batch_sz)]
+            collate = numpyAlignCollate(self.imgH, imgW=new_W, fill=fill_color)
+        collate = timers.timed('crnn_preprocess')(collate)
+        val_loader = self.pool.iterate(NumpyListLoader(img_list, to_pil=False), batches, collate_fn=collate)
+
+        values = [None] * num_files
+        scores = [None] * num_files
         # begin = time.time()
         with torch.no_grad():
-            for i in range(max_iter):
-                data = val_iter.next()
+            for indices, data in zip(batches, val_loader):
                 cpu_images, cpu_texts, _ = data
                 batch_size = cpu_images.size(0)
                 utils.loadData(self.image, cpu_images)
-                preds = self.model(self.image)
-                preds_size = Variable(torch.IntTensor([preds.size(0)] * batch_size))
-                _, preds = preds.max(2)
-                preds = preds.transpose(1, 0).contiguous().view(-1)
-                sim_pred = self.converter.decode(preds.data, preds_size.data, raw=False)
-                raw_pred = self.converter.decode(preds.data, preds_size.data, raw=True)
-                values.extend(sim_pred)
+                with timers.timer('crnn_forward'):
+                    preds = self.model(self.image)
+                with timers.timer('ctc_decode'):
+                    sim_pred, _, sim_scores = self.converter.decode_batch(preds)
+                for idx, value, score in zip(indices, sim_pred, sim_scores):
+                    values[idx] = value
+                    scores[idx] = score
                 if debug:
+                    preds_size = Variable(torch.IntTensor([preds.size(0)] * batch_size))
+                    _, preds = preds.max(2)
+                    preds = preds.transpose(1, 0).contiguous().view(-1)
+                    raw_pred = self.converter.decode(preds.data, preds_size.data, raw=True)
                     print('\n   ', raw_pred)
                     print(' =>', sim_pred)
                     cv_img = cpu_images[0].permute(1, 2, 0).numpy()
@@ -314,6 +601,8 @@ class Classifier_CRNN:
         # processing_time = end - begin
         # print('Processing time:', processing_time)
         # print('Speed:', num_files / processing_time, 'fps')
+        if return_scores:
+            return values, scores
         return values
 
 
@@ -325,10 +614,11 @@ def crop_from_img_rectangle(img, left, top, right, bottom):
     left = max(0, left - extend_x)
     right = min(img.shape[1], right + extend_x)
     if left >= right or top >= bottom or left < 0 or right < 0 or left >= img.shape[1] or right >= img.shape[1]:
-        return True, None
+        return True, None, left, top, right, bottom
     return False, img[top:bottom, left:right], left, top, right, bottom
 
 
+@timers.timed('crop')
 def get_boxes_data(img, boxes):
     boxes_data = []
     boxes_info = []
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# encoding: utf-8
+
+import sys
+import threading
+import unittest
+origin_path = sys.path
+# the source roots predict_pytorch.py imports from
+sys.path = origin_path + ["..", "../detector", "../detector/detector_DB", "../utils", "../classifier",
+                          "../classifier/classifier_CRNN"]
+from ocr_pipeline import PipelineRunner, Stage
+sys.path = origin_path
+
+
+def broken_items(num_items):
+    for i in range(num_items):
+        yield i
+    raise IOError('broken input')
+
+
+class pipelineTestCase(unittest.TestCase):
+
+    def checkInputError(self):
+        runner = PipelineRunner([Stage('double', lambda x: 2 * x, 2), Stage('add', lambda x: x + 1)], queue_size=2)
+        results = []
+        result = dict()
+
+        def consume():
+            try:
+                for value in runner.run(broken_items(20)):
+                    results.append(value)
+            except RuntimeError as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=consume, daemon=True)
+        thread.start()
+        thread.join(timeout=30)
+        assert not thread.is_alive(), 'run blocked on a failing input iterator'
+        assert isinstance(result['error'].__cause__, IOError)
+        # the items read before the error are yielded first
+        assert results == [2 * i + 1 for i in range(20)]
+
+
+def _suite():
+    suite = unittest.TestSuite()
+    suite.addTest(pipelineTestCase("checkInputError"))
+    return suite
+
+
+if __name__ == "__main__":
+    suite = _suite()
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import torch
+
+
+class OnnxModel:
+    '''
+    Runs an exported ONNX graph on onnxruntime's CPU provider behind the call interface of the torch models:
+    takes a single float tensor and returns the first output as a tensor.
+    num_threads: intra-op threads, defaults to torch.get_num_threads() so both backends use the same cores.
+    '''
+    def __init__(self, path, num_threads=None):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = path
+
+    def __call__(self, data):
+        # a numpy view would make the storage of data non-resizable, the callers reuse their input tensors
+        data = np.ascontiguousarray(data.detach().cpu().clone().numpy(), dtype=np.float32)
+        return torch.from_numpy(self.session.run(None, {self.input_name: data})[0])
+
+    def eval(self):
+        return self
+
+    def __repr__(self):
+        return 'OnnxModel(%s)' % os.path.basename(self.path)
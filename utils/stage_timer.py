@@ -0,0 +1,140 @@
+import collections
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+num_timer_samples = 10000
+quantiles = (0.5, 0.95, 0.99)
+
+
+class TimerRegistry:
+    '''
+    Thread-safe registry of named stage timers.
+    Every timer keeps its call count, total time and the last num_samples durations for p50/p95/p99.
+
+        with timers.timer('detect_forward'):
+            pred = model(img)
+
+        @timers.timed('crop')
+        def get_boxes_data(...):
+    '''
+    def __init__(self, num_samples=num_timer_samples):
+        self.num_samples = num_samples
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=self.num_samples))
+        self.counts = collections.Counter()
+        self.totals = collections.Counter()
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.samples[name].append(seconds)
+            self.counts[name] += 1
+            self.totals[name] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - begin)
+
+    def timed(self, name):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+            self.totals.clear()
+
+    def summary(self):
+        '''{name: {count, total, mean, p50, p95, p99}}, times in milliseconds.'''
+        with self.lock:
+            result = collections.OrderedDict()
+            for name, samples in self.samples.items():
+                samples = np.array(samples) * 1000.
+                stats = {'count': self.counts[name],
+                         'total': round(self.totals[name] * 1000., 3),
+                         'mean': round(self.totals[name] * 1000. / self.counts[name], 3)}
+                for q in quantiles:
+                    stats['p%d' % int(q * 100)] = round(float(np.percentile(samples, q * 100)), 3)
+                result[name] = stats
+            return result
+
+    def report(self):
+        for name, stats in self.summary().items():
+            print('%-24s count %6d  mean %10.3f ms  p50 %10.3f  p95 %10.3f  p99 %10.3f' % (
+                name, stats['count'], stats['mean'], stats['p50'], stats['p95'], stats['p99']))
+
+    def to_json(self, path=None):
+        text = json.dumps(self.summary(), indent=2)
+        if path is not None:
+            write_atomic(path, text)
+        return text
+
+    def to_prometheus(self, path=None, metric='ocr_stage_seconds'):
+        '''Prometheus text exposition (summary type), e.g. for the node_exporter textfile collector.'''
+        lines = ['# HELP %s Time spent in every OCR pipeline stage.' % metric,
+                 '# TYPE %s summary' % metric]
+        with self.lock:
+            for name, samples in self.samples.items():
+                samples = np.array(samples)
+                for q in quantiles:
+                    lines.append('%s{stage="%s",quantile="%s"} %.6f' % (
+                        metric, name, q, float(np.percentile(samples, q * 100))))
+                lines.append('%s_sum{stage="%s"} %.6f' % (metric, name, self.totals[name]))
+                lines.append('%s_count{stage="%s"} %d' % (metric, name, self.counts[name]))
+        text = '\n'.join(lines) + '\n'
+        if path is not None:
+            write_atomic(path, text)
+        return text
+
+
+def write_atomic(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def profile(kind=None, output_path='profile'):
+    '''
+    Profile the enclosed code, e.g. a single request.
+    kind: None (disabled), 'cprofile' (writes output_path.prof, for pstats/snakeviz)
+        or 'torch' (torch.profiler, writes output_path.json chrome trace).
+    '''
+    if kind is None:
+        yield
+    elif kind == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output_path + '.prof')
+    elif kind == 'torch':
+        import torch.profiler
+        with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                    record_shapes=True) as profiler:
+            yield
+        profiler.export_chrome_trace(output_path + '.json')
+    else:
+        raise ValueError('Unknown profiler: %s' % kind)
+
+
+timers = TimerRegistry()